@@ -0,0 +1,209 @@
+import collections
+import hashlib
+import os
+import shutil
+import uuid
+
+from . import config
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+def digest(*parts):
+    """ SHA-256 hex digest over all given parts, either bytes-like or str.
+    Parts are length-prefixed so that different splits never collide. """
+    hasher = hashlib.sha256()
+    for part in parts:
+        try:
+            part = memoryview(part)
+        except TypeError:
+            part = memoryview(str(part).encode('utf-8'))
+        hasher.update(b'%d:' % part.nbytes)
+        hasher.update(part)
+    return hasher.hexdigest()
+
+
+def digest_file(path):
+    """ SHA-256 hex digest of a file's content, None if it cannot be read. """
+    hasher = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f_handle:
+            while True:
+                chunk = f_handle.read(1024 * 1024)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+    except OSError:
+        return None
+    return hasher.hexdigest()
+
+
+def link_or_copy(src, dst):
+    """ Hard links src to dst if possible, copies the file otherwise. """
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return
+
+
+class FileLock:
+    """ Exclusive lock on a file, held across processes. Use with the 'with'
+    statement. """
+
+    def __init__(self, path):
+        self.path = path
+        self.__file_handle = None
+        return
+
+    def __enter__(self):
+        self.__file_handle = open(self.path, 'a+b')
+        if fcntl:
+            fcntl.flock(self.__file_handle.fileno(), fcntl.LOCK_EX)
+        else:
+            self.__file_handle.seek(0)
+            msvcrt.locking(self.__file_handle.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *args):
+        if fcntl:
+            fcntl.flock(self.__file_handle.fileno(), fcntl.LOCK_UN)
+        else:
+            self.__file_handle.seek(0)
+            msvcrt.locking(self.__file_handle.fileno(), msvcrt.LK_UNLCK, 1)
+        self.__file_handle.close()
+        self.__file_handle = None
+        return False
+    pass
+
+
+class DiskCache:
+    """ Persistent content-addressed storage of files under the 'cache_dir'
+    configuration, shared by all processes using the same directory.
+
+        name : Sub-directory of this cache.
+        max_size : Maximum total size in bytes, least recently used entries
+                are evicted when exceeded. Zero or None disables the cache.
+
+    Entries are addressed by keys, typically created with digest(). """
+
+    def __init__(self, name, max_size=0):
+        self.path = os.path.join(config.get_config('cache_dir'), name)
+        self.max_size = max_size
+        return
+
+    def enabled(self):
+        return bool(self.max_size)
+
+    def lock(self):
+        """ lock() -- Lock of the whole cache, across processes. """
+        if not os.path.exists(self.path):
+            os.makedirs(self.path, exist_ok=True)
+        return FileLock(os.path.join(self.path, '.lock'))
+
+    def fetch(self, key, dst):
+        """ fetch(key, dst) -- Place the entry at dst, returns whether it
+        existed. dst may be linked to the entry and must not be modified in
+        place. Should be called with the lock held. """
+        entry = os.path.join(self.path, key)
+        if not os.path.exists(entry):
+            return False
+        link_or_copy(entry, dst)
+        os.utime(entry)  # Marking as recently used
+        return True
+
+    def load(self, key):
+        """ load(key) -- Content of the entry in bytes, None if missing. Should
+        be called with the lock held. """
+        entry = os.path.join(self.path, key)
+        try:
+            with open(entry, 'rb') as f_handle:
+                data = f_handle.read()
+        except OSError:
+            return None
+        os.utime(entry)  # Marking as recently used
+        return data
+
+    def save(self, key, data):
+        """ save(key, data) -- Save bytes as the entry. Should be called with
+        the lock held. """
+        entry = os.path.join(self.path, key)
+        tmp_entry = os.path.join(self.path, '.%s' % uuid.uuid4())
+        with open(tmp_entry, 'wb') as f_handle:
+            f_handle.write(data)
+        os.replace(tmp_entry, entry)
+        self.evict()
+        return
+
+    def store(self, key, src):
+        """ store(key, src) -- Save a copy of file src as the entry. Should be
+        called with the lock held. """
+        entry = os.path.join(self.path, key)
+        tmp_entry = os.path.join(self.path, '.%s' % uuid.uuid4())
+        shutil.copy(src, tmp_entry)
+        os.replace(tmp_entry, entry)
+        self.evict()
+        return
+
+    def evict(self):
+        """ evict() -- Remove least recently used entries until the cache fits
+        into its maximum size. Should be called with the lock held. """
+        entries = []
+        total_size = 0
+        for item in os.scandir(self.path):
+            if item.name.startswith('.') or not item.is_file():
+                continue
+            stat = item.stat()
+            entries.append((stat.st_mtime, stat.st_size, item.path))
+            total_size += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+        return
+    pass
+
+
+class MemoryCache:
+    """ In-memory counterpart of DiskCache holding arbitrary objects, each
+    with a given size. Least recently used objects are dropped once the total
+    size exceeds max_size. Zero or None disables the cache. """
+
+    def __init__(self, max_size=0):
+        self.max_size = max_size
+        self.__entries = collections.OrderedDict()
+        self.__total_size = 0
+        return
+
+    def enabled(self):
+        return bool(self.max_size)
+
+    def get(self, key):
+        """ get(key) -- The cached object, None if missing. """
+        if key not in self.__entries:
+            return None
+        self.__entries.move_to_end(key)
+        return self.__entries[key][0]
+
+    def put(self, key, value, size):
+        """ put(key, value, size) -- Cache an object of the given size. """
+        if key in self.__entries:
+            self.__total_size -= self.__entries.pop(key)[1]
+        if size > self.max_size:
+            return
+        self.__entries[key] = (value, size)
+        self.__total_size += size
+        while self.__total_size > self.max_size:
+            _, (_, old_size) = self.__entries.popitem(last=False)
+            self.__total_size -= old_size
+        return
+    pass
@@ -0,0 +1,299 @@
+import atexit
+import os
+import re
+import threading
+import time
+
+from . import config
+
+# Whether the configured root is usable, checked once per root
+__availability = {}
+# Pool of leaves of the current process, see get_pool()
+__pool = None
+__pool_lock = threading.Lock()
+
+
+def available():
+    """ Whether processes could be accounted in cgroup v2 leaves under the
+    'cgroup_root' configuration. The root must be a cgroup delegated to this
+    user without processes of its own, and offer the memory controller. The
+    pids and cpu controllers are enabled as well where offered. """
+    root = config.get_config('cgroup_root')
+    if not root:
+        return False
+    if root not in __availability:
+        __availability[root] = enable_controllers(root, ['memory'])
+        if __availability[root]:
+            enable_controllers(root, ['pids'])
+            enable_controllers(root, ['cpu'])
+    return __availability[root]
+
+
+def enable_controllers(root, controllers):
+    """ Enables controllers for the children of root, returns whether all of
+    them are available there. """
+    try:
+        with open(os.path.join(root, 'cgroup.controllers'), 'r') as f_handle:
+            offered = f_handle.read().split()
+        with open(os.path.join(root, 'cgroup.subtree_control'), 'r') as f_handle:
+            enabled = f_handle.read().split()
+        for controller in controllers:
+            if controller not in offered:
+                return False
+            if controller in enabled:
+                continue
+            with open(os.path.join(root, 'cgroup.subtree_control'), 'w') as f_handle:
+                f_handle.write('+%s' % controller)
+            continue
+    except OSError:
+        return False
+    return True
+
+
+class Cgroup:
+    """ Leaf cgroup under the 'cgroup_root' configuration, which a process
+    joins before exec so that the kernel accounts all of its memory. Leaves
+    are reused for many processes one after another, prepare() sets up the
+    limits and the baselines of accounting before each. Leaves are used only
+    once where the kernel could not reset their peak (see reusable).
+
+    The kernel charges page cache to the leaf as well, e.g. of output files
+    written by the process. It is reclaimed before the process runs out of
+    memory, and left out of peak_memory() as far as it remains in the end. """
+
+    def __init__(self, path):
+        self.path = path
+        self.procs_path = os.path.join(path, 'cgroup.procs')
+        self.reusable = True
+        self.__fresh = True
+        self.__peak_fd = None
+        self.__events_base = {}
+        return
+
+    @classmethod
+    def create(cls, name):
+        """ create(name) -- A new leaf under the root, None upon failure. """
+        path = os.path.join(config.get_config('cgroup_root'), name)
+        try:
+            os.mkdir(path)
+        except OSError:
+            return None
+        return cls(path)
+
+    def read(self, name):
+        with open(os.path.join(self.path, name), 'r') as f_handle:
+            return f_handle.read()
+
+    def write(self, name, value):
+        with open(os.path.join(self.path, name), 'w') as f_handle:
+            f_handle.write(value)
+        return
+
+    def prepare(self, memory_limit):
+        """ prepare(memory_limit) -- Set up limits for the next process, where
+        the kernel kills it upon exceeding memory_limit in bytes (zero means no
+        limit). Returns whether its peak memory could be told exactly. """
+        self.write('memory.max', str(memory_limit) if memory_limit > 0
+                   else 'max')
+        for name, value in [('memory.swap.max', '0'),  # Swap escapes limits
+                            ('pids.max', config.get_config('cgroup_pids_max')),
+                            ('cpu.max', config.get_config('cgroup_cpu_max'))]:
+            try:
+                self.write(name, str(value or 'max'))
+            except OSError:
+                pass
+            continue
+        self.__events_base = self.__read_events()
+        # Writing to memory.peak resets the peak seen through the same file
+        # descriptor (Linux 6.12), so that leaves could be reused
+        fresh, self.__fresh = self.__fresh, False
+        peak_path = os.path.join(self.path, 'memory.peak')
+        try:
+            if self.__peak_fd is None:
+                self.__peak_fd = os.open(peak_path, os.O_RDWR)
+            os.write(self.__peak_fd, b'reset')
+            return True
+        except OSError:
+            pass
+        # Older kernels tell the peak since creation, exact on a fresh leaf
+        self.reusable = False
+        if self.__peak_fd is None:
+            try:
+                self.__peak_fd = os.open(peak_path, os.O_RDONLY)
+            except OSError:
+                return False
+        return fresh
+
+    def attach(self):
+        """ attach() -- Move the calling process into this cgroup, called in
+        the child between fork and exec. """
+        with open(self.procs_path, 'w') as f_handle:
+            f_handle.write('0')
+        return
+
+    def peak_memory(self):
+        """ peak_memory() -- Peak memory usage in bytes since prepare(), less
+        the page cache charged to the leaf by now. """
+        try:
+            peak = int(os.pread(self.__peak_fd, 64, 0))
+        except (OSError, TypeError, ValueError):
+            return 0
+        return max(peak - self.__read_stat().get('file', 0), 0)
+
+    def memory_events(self):
+        """ memory_events() -- Counters of memory events since prepare(), e.g.
+        'oom_kill'. """
+        events = self.__read_events()
+        for name in events:
+            events[name] -= self.__events_base.get(name, 0)
+            continue
+        return events
+
+    def __read_stat(self):
+        stat = {}
+        try:
+            for line in self.read('memory.stat').splitlines():
+                name, value = line.split()
+                stat[name] = int(value)
+                continue
+        except (OSError, ValueError):
+            pass
+        return stat
+
+    def __read_events(self):
+        events = {}
+        try:
+            for line in self.read('memory.events').splitlines():
+                name, count = line.split()
+                events[name] = int(count)
+                continue
+        except (OSError, ValueError):
+            pass
+        return events
+
+    def clear(self):
+        """ clear() -- Kill whatever the last process left behind, and drop
+        its page cache from the accounting. Returns whether the leaf is empty
+        and could be reused. """
+        try:
+            self.write('cgroup.kill', '1')
+        except OSError:
+            pass
+        try:
+            self.write('memory.reclaim', str(1 << 40))
+        except OSError:
+            pass
+        # Killed processes take a moment to leave
+        for i in range(0, 50):
+            try:
+                if 'populated 0' in self.read('cgroup.events'):
+                    return True
+            except OSError:
+                return False
+            time.sleep(0.002)
+            continue
+        return False
+
+    def remove(self):
+        """ remove() -- Remove the leaf, which must have no processes left. """
+        if self.__peak_fd is not None:
+            os.close(self.__peak_fd)
+            self.__peak_fd = None
+        try:
+            os.rmdir(self.path)
+        except OSError:
+            pass
+        return
+    pass
+
+
+class CgroupPool:
+    """ Leaves created ahead of time and reused by processes, sparing the
+    creation and removal of a cgroup on every execution. Leaves are named
+    after the owning process, those left by terminated processes are removed
+    when a pool is created.
+
+        size : Count of leaves created ahead of time and kept idle at most. """
+
+    def __init__(self, size):
+        self.size = size
+        self.pid = os.getpid()
+        self.__idle = []
+        self.__count = 0
+        self.__lock = threading.Lock()
+        self.__remove_stale()
+        for i in range(0, size):
+            leaf = self.__create()
+            if leaf:
+                self.__idle.append(leaf)
+            continue
+        return
+
+    def __create(self):
+        with self.__lock:
+            self.__count += 1
+            name = 'pyjudge-%d-%d' % (self.pid, self.__count)
+        return Cgroup.create(name)
+
+    def __remove_stale(self):
+        root = config.get_config('cgroup_root')
+        try:
+            items = list(os.scandir(root))
+        except OSError:
+            return
+        for item in items:
+            match = re.match(r'^pyjudge-(\d+)-\d+$', item.name)
+            if not match or not item.is_dir():
+                continue
+            try:
+                os.kill(int(match.group(1)), 0)
+                continue
+            except ProcessLookupError:
+                pass
+            except OSError:
+                continue
+            Cgroup(item.path).remove()
+            continue
+        return
+
+    def acquire(self):
+        """ acquire() -- An idle leaf, created if there are none left. None if
+        no leaf could be created. """
+        with self.__lock:
+            if self.__idle:
+                return self.__idle.pop()
+        return self.__create()
+
+    def release(self, leaf):
+        """ release(leaf) -- Return a leaf once its process is reaped, which
+        is replaced by a fresh one later on if it could not be reused. """
+        reusable = leaf.clear() and leaf.reusable
+        with self.__lock:
+            if reusable and len(self.__idle) < self.size:
+                self.__idle.append(leaf)
+                return
+        leaf.remove()
+        return
+
+    def close(self):
+        """ close() -- Remove all idle leaves. """
+        with self.__lock:
+            idle, self.__idle = self.__idle, []
+        for leaf in idle:
+            leaf.remove()
+            continue
+        return
+    pass
+
+
+def get_pool():
+    """ The pool of leaves of the current process, None if cgroups are not
+    available. Forked processes create pools of their own. """
+    global __pool
+    if not available():
+        return None
+    with __pool_lock:
+        if __pool is None or __pool.pid != os.getpid():
+            __pool = CgroupPool(config.get_config('cgroup_pool_size') or 0)
+            atexit.register(__pool.close)
+        return __pool
@@ -0,0 +1,234 @@
+import collections
+import os
+
+from . import compare
+from . import compiler
+from . import config
+from . import tmpmgmt
+
+
+class CheckerResult:
+    """ Result of checker, either 'AC', 'WA' or 'PE', or 'IJI' if the checker
+    itself failed. Message describes the verdict, which may be empty. """
+
+    def __init__(self,
+                 judge_result='AC',
+                 message=''):
+        self.judge_result = judge_result
+        self.message = message
+        return
+    pass
+
+
+class Checker:
+    """ Base checker, telling whether the user output is acceptable. Extend
+    this class for further functionalities.
+
+    needs_input tells whether check() makes use of the input data, which may
+    otherwise be left out. """
+
+    needs_input = False
+
+    def compile(self):
+        """ compile() -- Prepare the checker, raises CompilerError upon
+        failure. """
+        return compiler.CompilerResult(return_code=0)
+
+    def check(self, input_data, out, std):
+        """ check(input_data, out, std) -- Check user output against standard
+        output, all being str or bytes-like. Returns a CheckerResult. """
+        raise NotImplementedError()
+
+    def close(self):
+        """ close() -- Release everything prepared. """
+        return
+    pass
+
+
+class ExactChecker(Checker):
+    """ Requires outputs to be identical byte by byte. Outputs differing only
+    in whitespaces cause a presentation error. """
+
+    def check(self, input_data, out, std):
+        if type(out) == str or type(std) == str:
+            if out == std:
+                return CheckerResult('AC')
+        else:
+            with memoryview(out) as out_view, memoryview(std) as std_view:
+                if out_view == std_view:
+                    return CheckerResult('AC')
+        mismatch = compare.compare_tokens(out, std)
+        if mismatch:
+            return CheckerResult('WA', mismatch)
+        return CheckerResult('PE', 'Outputs differ in whitespaces')
+    pass
+
+
+class TokenChecker(Checker):
+    """ Compares outputs token by token, ignoring differences between
+    whitespaces. This is the default checker. """
+
+    def check(self, input_data, out, std):
+        mismatch = compare.compare_tokens(out, std)
+        if mismatch:
+            return CheckerResult('WA', mismatch)
+        return CheckerResult('AC')
+    pass
+
+
+class FloatChecker(Checker):
+    """ Compares outputs token by token, where numbers are accepted within an
+    absolute or relative error of abs_eps or rel_eps. """
+
+    def __init__(self, abs_eps=1e-6, rel_eps=1e-6):
+        self.abs_eps = abs_eps
+        self.rel_eps = rel_eps
+        self.__token_equal = compare.float_token_equal(abs_eps, rel_eps)
+        return
+
+    def check(self, input_data, out, std):
+        mismatch = compare.compare_tokens(
+            out, std, token_equal=self.__token_equal)
+        if mismatch:
+            return CheckerResult('WA', mismatch)
+        return CheckerResult('AC')
+    pass
+
+
+class LineChecker(Checker):
+    """ Compares outputs line by line, ignoring trailing whitespaces and empty
+    lines at the end. """
+
+    def check(self, input_data, out, std):
+        out_lines = compare.iter_lines(out)
+        line = 0
+        for std_line in compare.iter_lines(std):
+            line += 1
+            out_line = next(out_lines, None)
+            if out_line is None:
+                return CheckerResult('WA', 'Output ended early, expected %s '
+                                     'at line %d' % (compare.describe_token(std_line), line))
+            if out_line != std_line:
+                return CheckerResult('WA', 'Expected %s, found %s at line %d' % (
+                    compare.describe_token(std_line),
+                    compare.describe_token(out_line), line))
+            continue
+        out_line = next(out_lines, None)
+        if out_line is not None:
+            return CheckerResult('WA', 'Unexpected %s at line %d' % (
+                compare.describe_token(out_line), line + 1))
+        return CheckerResult('AC')
+    pass
+
+
+class UnorderedLinesChecker(Checker):
+    """ Requires the same lines as standard output in any order, ignoring
+    trailing whitespaces and empty lines. """
+
+    def check(self, input_data, out, std):
+        lines = collections.Counter(
+            line for line in compare.iter_lines(std) if line)
+        for line in compare.iter_lines(out):
+            if not line:
+                continue
+            if not lines[line]:
+                return CheckerResult('WA', 'Unexpected line %s' %
+                                     compare.describe_token(line))
+            lines[line] -= 1
+            continue
+        for line in lines:
+            if lines[line]:
+                return CheckerResult('WA', 'Missing line %s' %
+                                     compare.describe_token(line))
+            continue
+        return CheckerResult('AC')
+    pass
+
+
+class TestlibChecker(Checker):
+    """ External checker following testlib conventions, invoked as 'checker
+    <input> <output> <answer>'. Exit codes 0, 1 and 2 stand for AC, WA and PE,
+    and the error output is taken as message. The source is compiled through
+    AdaptiveCompiler once, then reused on every check. Checks run under
+    'checker_time_limit' and 'checker_memory_limit', checkers exceeding them
+    fail as 'IJI'. """
+
+    needs_input = True
+    exit_codes = {
+        0: 'AC',
+        1: 'WA',
+        2: 'PE',
+        4: 'PE',  # Dirt after the end of output
+        7: 'WA',  # Partial points
+        8: 'WA',  # Unexpected end of output
+    }
+
+    def __init__(self, source_path, source_type=None):
+        self.source_path = source_path
+        self.handle = compiler.AdaptiveCompiler(
+            source_path, source_type=source_type)
+        return
+
+    def compile(self):
+        return self.handle.compile()
+
+    def check(self, input_data, out, std):
+        time_limit = config.get_config('checker_time_limit') or 0
+        memory_limit = config.get_config('checker_memory_limit') or 0
+        paths = []
+        try:
+            for data in [input_data, out, std]:
+                path = tmpmgmt.create_tmpfile()
+                paths.append(path)
+                with open(path, 'wb') as f_handle:
+                    if type(data) == str:
+                        data = data.encode('utf-8')
+                    f_handle.write(data)
+                continue
+            ret = self.handle.execute(
+                additional_args=paths,
+                time_limit=time_limit,
+                memory_limit=memory_limit)
+        finally:
+            for path in paths:
+                tmpmgmt.remove_tmpfile(path)
+                continue
+        if ret.time == time_limit > 0:
+            return CheckerResult('IJI', 'Checker exceeded time limit of %d ms'
+                                 % time_limit)
+        if ret.memory == memory_limit > 0:
+            return CheckerResult('IJI', 'Checker exceeded memory limit of %d '
+                                 'bytes' % memory_limit)
+        message = ret.stderr_text.strip()
+        if ret.return_code not in self.exit_codes:
+            return CheckerResult('IJI', message or
+                                 'Checker exited with code %d' % ret.return_code)
+        return CheckerResult(self.exit_codes[ret.return_code], message)
+
+    def close(self):
+        if self.handle.compiled():
+            self.handle.close()
+        return
+    pass
+
+
+builtin_checkers = {
+    'exact': ExactChecker,
+    'tokens': TokenChecker,
+    'float': FloatChecker,
+    'lines': LineChecker,
+    'unordered': UnorderedLinesChecker,
+}
+
+
+def create_checker(name, float_eps=None):
+    """ Creates a built-in checker by its name, or a testlib checker from the
+    source file at the path otherwise. float_eps sets both errors allowed by
+    the float checker. """
+    if name in builtin_checkers:
+        if name == 'float' and float_eps is not None:
+            return FloatChecker(abs_eps=float_eps, rel_eps=float_eps)
+        return builtin_checkers[name]()
+    if not os.path.exists(name):
+        raise ValueError('Unknown checker: %s' % name)
+    return TestlibChecker(name)
@@ -0,0 +1,188 @@
+import math
+import re
+
+# Whitespaces as recognized throughout comparisons
+whitespace_pattern = re.compile(r'[ \t\r\n]')
+whitespace_pattern_bytes = re.compile(rb'[ \t\r\n]')
+token_pattern = re.compile(r'[^ \t\r\n]+')
+token_pattern_bytes = re.compile(rb'[^ \t\r\n]+')
+# Whitespaces that split() recognizes in addition, rare enough in practice
+split_whitespace_pattern = re.compile(r'[\x0b\x0c\x1c-\x1f]')
+split_whitespace_pattern_bytes = re.compile(rb'[\x0b\x0c]')
+
+
+class TokenStream:
+    """ Reads whitespace-separated tokens from str or bytes-like data, one
+    chunk at a time. Chunks are cut at whitespaces so that tokens are never
+    broken, and only the current chunk is held in memory.
+
+        tokens : Tokens of the current chunk.
+        index : Index of the next unread token in the current chunk. """
+
+    def __init__(self, data, chunk_size=1024*1024):
+        self.data = data
+        self.chunk_size = chunk_size
+        if type(data) == str:
+            self.__whitespace = whitespace_pattern
+            self.__token = token_pattern
+            self.__split_whitespace = split_whitespace_pattern
+            self.__newline = '\n'
+        else:
+            self.__whitespace = whitespace_pattern_bytes
+            self.__token = token_pattern_bytes
+            self.__split_whitespace = split_whitespace_pattern_bytes
+            self.__newline = b'\n'
+        self.tokens = []
+        self.index = 0
+        self.__chunk = self.__newline[:0]
+        self.__chunk_begin = 0
+        self.__next_begin = 0
+        self.__line = 1  # Line at the beginning of the chunk
+        self.__line_begin = 0  # Offset of that line's beginning
+        return
+
+    def remaining(self):
+        """ remaining() -- Count of unread tokens in the current chunk, reading
+        the next chunk if there are none. Zero if the data is exhausted. """
+        while self.index >= len(self.tokens):
+            if self.__next_begin >= len(self.data):
+                return 0
+            self.__read_chunk()
+        return len(self.tokens) - self.index
+
+    def __read_chunk(self):
+        # Keeping track of lines passed in the previous chunk
+        self.__line += self.__chunk.count(self.__newline)
+        last_newline = self.__chunk.rfind(self.__newline)
+        if last_newline >= 0:
+            self.__line_begin = self.__chunk_begin + last_newline + 1
+        # Extending chunk to the next whitespace
+        begin = self.__next_begin
+        end = begin + self.chunk_size
+        if end < len(self.data):
+            match = self.__whitespace.search(self.data, end)
+            end = match.start() if match else len(self.data)
+        else:
+            end = len(self.data)
+        self.__chunk = self.data[begin:end]
+        self.__chunk_begin = begin
+        self.__next_begin = end
+        # Built-in split() is much faster, if it splits the same way
+        if self.__chunk.isascii() and \
+                not self.__split_whitespace.search(self.__chunk):
+            self.tokens = self.__chunk.split()
+        else:
+            self.tokens = self.__token.findall(self.__chunk)
+        self.index = 0
+        return
+
+    def position(self, index):
+        """ position(index) -- Line and column of the token at the index in the
+        current chunk, both counted from 1. """
+        for i, match in enumerate(self.__token.finditer(self.__chunk)):
+            if i == index:
+                break
+            continue
+        offset = match.start()
+        line = self.__line + self.__chunk.count(self.__newline, 0, offset)
+        line_begin = self.__chunk.rfind(self.__newline, 0, offset)
+        if line_begin >= 0:
+            column = offset - line_begin
+        else:
+            column = self.__chunk_begin + offset - self.__line_begin + 1
+        return line, column
+    pass
+
+
+def describe_token(token):
+    """ Printable form of a token, truncated when too long. """
+    if type(token) != str:
+        token = bytes(token).decode('utf-8', 'ignore')
+    if len(token) > 32:
+        token = token[:32] + '...'
+    return '"%s"' % token
+
+
+def compare_tokens(out, std, token_equal=None):
+    """ Compares two outputs token by token in a single pass, ignoring
+    differences between whitespaces. Returns None if they match, or a
+    description of the first mismatch with its position otherwise.
+
+        token_equal: Function telling whether an output token matches the
+                standard one, default to exact equality. """
+    out_stream = TokenStream(out)
+    std_stream = TokenStream(std)
+    while True:
+        out_count = out_stream.remaining()
+        std_count = std_stream.remaining()
+        if out_count == 0 and std_count == 0:
+            return None
+        if out_count == 0:
+            token = std_stream.tokens[std_stream.index]
+            line, column = std_stream.position(std_stream.index)
+            return 'Output ended early, expected %s at line %d, column %d ' \
+                'of standard output' % (describe_token(token), line, column)
+        if std_count == 0:
+            token = out_stream.tokens[out_stream.index]
+            line, column = out_stream.position(out_stream.index)
+            return 'Unexpected %s at line %d, column %d' % (
+                describe_token(token), line, column)
+        # Comparing as many tokens as both chunks have at once
+        count = min(out_count, std_count)
+        out_tokens = out_stream.tokens[out_stream.index:out_stream.index + count]
+        std_tokens = std_stream.tokens[std_stream.index:std_stream.index + count]
+        if out_tokens != std_tokens:
+            i = 0
+            while i < count and (out_tokens[i] == std_tokens[i] or (
+                    token_equal and token_equal(out_tokens[i], std_tokens[i]))):
+                i += 1
+        else:
+            i = count
+        if i < count:
+            line, column = out_stream.position(out_stream.index + i)
+            return 'Expected %s, found %s at line %d, column %d' % (
+                describe_token(std_tokens[i]), describe_token(out_tokens[i]),
+                line, column)
+        out_stream.index += count
+        std_stream.index += count
+        continue
+    return None
+
+
+def float_token_equal(abs_eps, rel_eps):
+    """ Token comparison accepting numbers within an absolute or relative
+    error from the standard, other tokens must be equal. """
+    def token_equal(out, std):
+        if out == std:
+            return True
+        try:
+            out_value = float(out)
+            std_value = float(std)
+        except ValueError:
+            return False
+        if math.isnan(out_value) or math.isnan(std_value):
+            return math.isnan(out_value) and math.isnan(std_value)
+        if math.isinf(out_value) or math.isinf(std_value):
+            return out_value == std_value
+        error = abs(out_value - std_value)
+        return error <= abs_eps or error <= rel_eps * abs(std_value)
+    return token_equal
+
+
+def iter_lines(data):
+    """ Lines of str or bytes-like data with trailing whitespaces removed,
+    sliced one at a time. Trailing empty lines are omitted. """
+    newline = '\n' if type(data) == str else b'\n'
+    end = len(data)
+    # Dropping trailing empty lines at once
+    while end > 0 and data[end - 1:end].isspace():
+        end -= 1
+    begin = 0
+    while begin < end:
+        line_end = data.find(newline, begin, end)
+        if line_end < 0:
+            line_end = end
+        yield data[begin:line_end].rstrip()
+        begin = line_end + 1
+        continue
+    return
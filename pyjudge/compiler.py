@@ -1,11 +1,14 @@
 import copy
 import os
 import re
+import threading
 
+from . import cache
 from . import config
 from . import process
 from . import table
 from . import tmpmgmt
+from . import zygote
 
 
 class CompilerError(Exception):
@@ -33,6 +36,80 @@ class CompilerResult:
     pass
 
 
+__compiler_versions = {}
+
+
+def get_compiler_version(executable):
+    """ Version banner of the compiler executable, None if it cannot be run.
+    Results are memoized throughout the process. """
+    if executable not in __compiler_versions:
+        try:
+            proc = process.Process(
+                time_limit=5000,
+                memory_limit=0,
+                process_args=[executable, '--version'],
+                output_limit=0)
+            ret_result = proc.execute()
+            __compiler_versions[executable] = bytes(ret_result.stdout)
+        except OSError:
+            __compiler_versions[executable] = None
+    return __compiler_versions[executable]
+
+
+__precompiled_headers = {}
+
+
+def get_precompiled_header(args, header='bits/stdc++.h'):
+    """ Include directory serving header precompiled for compiles with the
+    arguments, which is built upon first use and kept under 'cache_dir' for
+    the same compiler and flags. None if it cannot be built. The directory
+    holds a wrapper of the header with its '.gch', compilers fall back to the
+    wrapper (and the original header) should the '.gch' not apply. """
+    flags = []
+    skip_next = False
+    for arg in args[1:]:
+        if skip_next:
+            skip_next = False
+        elif arg == '-o':
+            skip_next = True
+        elif '{source_file}' in arg or '{output_file}' in arg or \
+                arg.startswith(('-l', '-L', '-Wl,')):
+            pass  # Inputs, outputs and linking
+        else:
+            flags.append(arg)
+        continue
+    version = get_compiler_version(args[0])
+    if version is None:
+        return None
+    pch_dir = os.path.join(config.get_config('cache_dir'), 'pch',
+                           cache.digest(version, header, args[0], *flags))
+    if pch_dir in __precompiled_headers:
+        return __precompiled_headers[pch_dir]
+    header_path = os.path.join(pch_dir, header)
+    gch_path = header_path + '.gch'
+    os.makedirs(os.path.dirname(header_path), exist_ok=True)
+    with cache.FileLock(os.path.join(pch_dir, '.lock')):
+        if not os.path.exists(gch_path):
+            with open(header_path, 'w') as f_handle:
+                f_handle.write('#include_next <%s>\n' % header)
+            tmp_gch_path = gch_path + '.tmp'
+            proc = process.Process(
+                time_limit=60000,
+                memory_limit=0,
+                process_args=[args[0]] + flags + [
+                    '-x', 'c++-header', header_path, '-o', tmp_gch_path],
+                output_limit=0  # Headers precompiled take 100 MB or so
+            )
+            ret_result = proc.execute()
+            if ret_result.return_code == 0:
+                os.replace(tmp_gch_path, gch_path)
+            elif os.path.exists(tmp_gch_path):
+                os.remove(tmp_gch_path)
+    __precompiled_headers[pch_dir] = \
+        pch_dir if os.path.exists(gch_path) else None
+    return __precompiled_headers[pch_dir]
+
+
 def wrap_compiler(input_class):
     class CompilerWrapper(input_class):
         def __init__(self, *args, **kwargs):
@@ -67,15 +144,6 @@ def wrap_compiler(input_class):
             if self.__sequence != 1:
                 raise AttributeError('Source code hadn\'t been compiled')
             ret = input_class.execute(self, *args, **kwargs)
-            # Converting bytes to str
-
-            def __create_clean_str(dat):
-                if type(dat) == bytes:
-                    dat = dat.decode('utf-8', 'ignore')
-                dat = dat.replace('\r', '')
-                return dat
-            ret.stdout = __create_clean_str(ret.stdout)
-            ret.stderr = __create_clean_str(ret.stderr)
             return ret
 
         def close(self):
@@ -95,7 +163,12 @@ def wrap_compiler(input_class):
 class Compiler:
     """ Basic compiler, all functions defined here when invoked without further
     definition would raise a NotImplementedError. Use inheritance for this
-    compiler, and should not be used as an instance. """
+    compiler, and should not be used as an instance.
+
+    runs_program tells whether execute() runs a program on the given input, as
+    opposed to compilers reproducing stored data regardless of input. """
+
+    runs_program = True
 
     def __init__(self, source_path):
         self.source_path = source_path
@@ -112,17 +185,30 @@ class Compiler:
     def close(self):
         """ close() -- Remove compiled executable. """
         raise NotImplementedError()
+
+    def seek(self, index):
+        """ seek(index) -- Position inputs with multiple cases at the given
+        test, other compilers produce the same data on every test. """
+        return
+
+    def case_numbers(self):
+        """ case_numbers() -- Numbers of the tests in order, for compilers
+        with numbered cases once compiled, otherwise None. """
+        return None
     pass
 
 
 @wrap_compiler
 class FileHandleCompiler(Compiler):
-    """ Handles a file in Unicode encoding. Does not actually compile files,
+    """ Handles a file, passed on in raw bytes. Does not actually compile files,
     only provides a compiler-like interface for files' handling. """
 
+    runs_program = False
+
     def compile(self, override_command=None):
         try:
-            self.__file_handle = open(self.source_path, 'r')
+            f_handle = open(self.source_path, 'r')
+            f_handle.close()
         except Exception:
             raise CompilerError('Unable to open file')
         ret_result = CompilerResult(
@@ -132,87 +218,282 @@ class FileHandleCompiler(Compiler):
         return ret_result
 
     def execute(self, additional_args=[], **kwargs):
+        # Opened on every execution, as judgers running in forked workers
+        # would otherwise share the offset of one file handle. Large files
+        # are mapped rather than read, and programs are given the file itself
+        # as input where possible (see stdout_path)
+        with open(self.source_path, 'rb') as f_handle:
+            data = process.map_file(f_handle)
         ret_result = process.ProcessResult(
             time=0,
             memory=0,
             return_code=0,
-            stdout=self.__file_handle.read(),
-            stderr='',
+            stdout=data,
+            stderr=b'',
+            stdout_path=self.source_path,
         )
-        self.__file_handle.seek(0)
         return ret_result
 
     def close(self):
-        self.__file_handle.close()
         return
     pass
 
 
+def prefetch_files(paths):
+    """ Brings files into the page cache ahead of use, each up to
+    'prefetch_size' bytes. The kernel reads ahead by posix_fadvise where
+    available, otherwise the files are read in chunks which are dropped. """
+    max_size = config.get_config('prefetch_size') or 0
+    for path in paths:
+        try:
+            with open(path, 'rb') as f_handle:
+                if hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(f_handle.fileno(), 0, max_size,
+                                     os.POSIX_FADV_WILLNEED)
+                    continue
+                size = 0
+                while size < max_size:
+                    chunk = f_handle.read(min(1024 * 1024, max_size - size))
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    continue
+        except OSError:
+            pass
+        continue
+    return
+
+
 @wrap_compiler
 class DirectoryFilesCompiler(Compiler):
-    """ Wraps files in directory for matching files. """
+    """ Wraps files in directory for matching files. The source path names
+    them with an asterisk after the extension, e.g. 'data.in*' for files like
+    'data1.in', 'data 02.in', 'data(3).in' or 'data.4.in'. The directory is
+    scanned once, where cases are ordered by their numbers without limits on
+    their count. Files are only opened once executed, while the following
+    'prefetch_cases' are read ahead into the page cache in background. """
+
+    runs_program = False
 
     def compile(self, override_command=None):
-        pattern_1 = r'\.([^.]*?)\*$'
-        pattern_2 = r'{number}.\1'
-        f_handles = []
-        for i in range(1, 101):  # Maximum allowed 100 inputs
-            def __test_available(src, i, *args):
-                for j in args:
-                    fn = re.sub(pattern_1, pattern_2.format(number=j % i), src)
-                    if os.path.exists(fn):
-                        return fn
-                    continue
-                return None
-            fn = __test_available(self.source_path, i, '%d', '0%d', ' %d',
-                                  ' 0%d', '(%d)', '(0%d)', ' (%d)', ' (0%d)', '.%d', '.0%d')
-            if not fn:
-                break
-            n_comp = FileHandleCompiler(fn)
-            try:
-                n_comp.compile()
-            except CompilerError:
-                if not n_comp.closed():
-                    n_comp.close()
-                break
-            f_handles.append((i, fn, n_comp))
-        self.__file_handle = f_handles
+        name_match = re.match(r'^(.*?)\.([^.]*?)\*$',
+                              os.path.basename(self.source_path))
+        if not name_match:
+            raise CompilerError('Unable to find any corresponding file')
+        directory = os.path.dirname(self.source_path)
+        pattern = re.compile(r'^%s(?: ?\((\d+)\)| ?(\d+)|\.(\d+))\.%s$' % (
+            re.escape(name_match.group(1)), re.escape(name_match.group(2))))
+        try:
+            items = sorted(os.scandir(directory or '.'),
+                           key=lambda item: item.name)
+        except OSError:
+            items = []
+        file_paths = {}
+        for item in items:
+            item_match = pattern.match(item.name)
+            if not item_match or not item.is_file():
+                continue
+            number = int(next(group for group in item_match.groups()
+                              if group is not None))
+            # The first of differently padded names is taken
+            file_paths.setdefault(number, os.path.join(directory, item.name))
+            continue
+        self.__case_numbers = sorted(file_paths)
+        self.__file_paths = [file_paths[i] for i in self.__case_numbers]
         self.__file_pointer = 0
-        if len(self.__file_handle) <= 0:
+        self.__prefetched = 0
+        if len(self.__file_paths) <= 0:
             raise CompilerError('Unable to find any corresponding file')
         return CompilerResult(return_code=0, output='')
 
     def execute(self, additional_args=[], **kwargs):
         try:
-            f_handle = self.__file_handle[self.__file_pointer][2]
+            f_handle = FileHandleCompiler(
+                self.__file_paths[self.__file_pointer])
+            self.__prefetch()
+            f_handle.compile()
             ret = f_handle.execute(additional_args, **kwargs)
-        except Exception as err:
-            raise err
         finally:
             self.__file_pointer += 1
-            if self.__file_pointer >= len(self.__file_handle):
+            if self.__file_pointer >= len(self.__file_paths):
                 self.__file_pointer = 0
             pass
         return ret
 
+    def seek(self, index):
+        self.__file_pointer = index % len(self.__file_paths)
+        return
+
+    def case_numbers(self):
+        return list(self.__case_numbers)
+
+    def __prefetch(self):
+        """ Reads cases following the current one ahead in a thread, those
+        not read ahead yet. """
+        count = min(config.get_config('prefetch_cases') or 0,
+                    len(self.__file_paths) - 1)
+        end = self.__file_pointer + 1 + count
+        if not self.__file_pointer < self.__prefetched <= end:
+            self.__prefetched = self.__file_pointer + 1  # Seeked elsewhere
+        begin = self.__prefetched
+        if begin >= end:
+            return
+        self.__prefetched = end
+        paths = [self.__file_paths[i % len(self.__file_paths)]
+                 for i in range(begin, end)]
+        threading.Thread(target=prefetch_files, args=(paths,),
+                         daemon=True).start()
+        return
+
     def close(self):
-        for tup in self.__file_handle:
-            f_handle = tup[2]
-            if not f_handle.closed():
-                f_handle.close()
-            continue
-        del self.__file_handle
+        del self.__case_numbers
+        del self.__file_paths
         del self.__file_pointer
+        del self.__prefetched
         return
     pass
 
 
+@wrap_compiler
+class MultiCaseCompiler(Compiler):
+    """ Wraps an input generator emitting many cases per run, sparing its
+    startup on every test. Receives following arguments:
+
+        handle : Compiler of the generator.
+        cases : Count of cases asked for, passed on as the last argument of
+                the generator (after the seed, if any).
+        delimiter : Line separating cases in the output, default to '---'.
+
+    Each execute() returns the next case of the output, which is split
+    lazily. The generator is run again once its cases are used up, it may
+    emit fewer cases than asked for. Results of cases carry the time and
+    memory of the whole run. """
+
+    def __init__(self, handle, cases, delimiter='---'):
+        Compiler.__init__(self, handle.source_path)
+        self.handle = handle
+        self.cases = cases
+        self.delimiter = delimiter.encode('utf-8')
+        self.runs_program = handle.runs_program
+        self.__result = None
+        self.__offset = 0
+        return
+
+    def compile(self, override_command=None):
+        return self.handle.compile(override_command)
+
+    def execute(self, additional_args=[], **kwargs):
+        # Streams set up by the caller are given the case afterwards
+        stdout = kwargs.pop('stdout', None)
+        case = self.__next_case()
+        if case is None:
+            ret = self.handle.execute(
+                additional_args=list(additional_args) + [str(self.cases)],
+                **kwargs)
+            if ret.return_code == 0:
+                self.__result = ret
+                self.__offset = 0
+                case = self.__next_case()
+            if case is None:
+                if stdout is not None:
+                    os.close(stdout)
+                return ret
+        # Only the case is carried, the whole output stays with this handle
+        ret = process.ProcessResult(
+            time=self.__result.time,
+            memory=self.__result.memory,
+            return_code=self.__result.return_code,
+            stdout=case,
+            cpu_time=self.__result.cpu_time,
+            wall_time=self.__result.wall_time)
+        if stdout is not None:
+            try:
+                with open(stdout, 'wb') as f_handle:
+                    f_handle.write(case)
+            except BrokenPipeError:
+                pass  # Reader has stopped
+        return ret
+
+    def __next_case(self):
+        """ Bytes of the next non-blank case in the output, None if there are
+        no cases left. """
+        if self.__result is None:
+            return None
+        data = self.__result.stdout
+        while self.__offset < len(data):
+            begin = self.__offset
+            end = next_begin = len(data)
+            pos = data.find(self.delimiter, begin)
+            while pos >= 0:
+                line_end = data.find(b'\n', pos)
+                if line_end < 0:
+                    line_end = len(data)
+                # Only delimiters on lines of their own separate cases
+                if (pos == 0 or data[pos - 1:pos] == b'\n') and \
+                        not data[pos + len(self.delimiter):line_end].strip():
+                    end = pos
+                    next_begin = line_end + 1
+                    break
+                pos = data.find(self.delimiter, pos + 1)
+                continue
+            self.__offset = next_begin
+            case = data[begin:end]
+            if case.strip():
+                return case
+            continue
+        self.__result = None
+        return None
+
+    def seek(self, index):
+        return
+
+    def close(self):
+        self.__result = None
+        if not self.handle.closed():
+            self.handle.close()
+        return
+    pass
+
+
+# Byte-compiles argv[1] into argv[2] under the interpreter of submissions,
+# valid for both Python 2 and 3
+python_compile_script = '''
+import py_compile, sys
+try:
+    py_compile.compile(sys.argv[1], cfile=sys.argv[2], doraise=True)
+except py_compile.PyCompileError as err:
+    sys.stderr.write(err.msg)
+    sys.exit(1)
+'''
+
+# Runs the bytecode argv[2] of the source argv[1] as the source would be run,
+# with sys.argv, sys.path[0] and __file__ following the source
+python_run_script = '''
+import os, pkgutil, sys, types
+bytecode = sys.argv.pop(2)
+sys.argv.pop(0)
+sys.path[0] = os.path.dirname(os.path.abspath(sys.argv[0]))
+with open(bytecode, 'rb') as f_handle:
+    code = pkgutil.read_code(f_handle)
+main = types.ModuleType('__main__')
+main.__file__ = sys.argv[0]
+main.__builtins__ = __builtins__
+bootstrap = sys.modules['__main__']  # Kept, Python 2 clears it once dropped
+sys.modules['__main__'] = main
+exec(code, main.__dict__)
+'''
+
+
 @wrap_compiler
 class PythonCompiler(Compiler):
-    """ Python compiler, a wrapper for Python 2 code execution. """
+    """ Python compiler, a wrapper for Python 2 code execution. The source is
+    byte-compiled by the configured interpreter once, where syntax errors
+    fail the compilation, and the bytecode is executed afterwards. """
 
     def __init__(self, source_path, version_number):
         Compiler.__init__(self, source_path)
+        self.version_number = version_number
+        self.__python_bytecode = None
         if version_number == 2:
             self.__python_args = config.get_config('python2_args')
         elif version_number == 3:
@@ -233,10 +514,53 @@ class PythonCompiler(Compiler):
             return_code=0,
             output='',
         )
+        # The interpreter precedes the source file in its arguments, others
+        # are left to run the source as they are
+        if '{source_file}' not in self.__python_args:
+            return ret_result
+        out_file = tmpmgmt.create_tmpfile()
+        interpreter_args = self.__python_args[
+            :self.__python_args.index('{source_file}')]
+        proc = process.Process(
+            time_limit=5000,
+            memory_limit=0,
+            process_args=interpreter_args + [
+                '-c', python_compile_script, self.source_path, out_file],
+            output_limit=0  # Bytecode is written as a file
+        )
+        try:
+            ret_result_old = proc.execute()
+        except OSError:
+            raise CompilerError('Unable to run interpreter')
+        if ret_result_old.return_code != 0:
+            tmpmgmt.remove_tmpfile(out_file)
+            raise CompilerError(ret_result_old.stderr_text)
+        self.__python_bytecode = out_file
         return ret_result
 
     def execute(self, additional_args=[], **kwargs):
         args = copy.deepcopy(self.__python_args)
+        # Python 3 programs are forked from a zygote of the interpreter, which
+        # takes the arguments before the source file. The bytecode is run in
+        # place of the source, which sys.argv and sys.path[0] still follow
+        if self.version_number == 3 and config.get_config('python_zygote') \
+                and process.platform_event_watchdog and \
+                zygote.platform_zygote and '{source_file}' in args:
+            split = args.index('{source_file}')
+            handle = zygote.get_zygote(
+                args[:split], config.get_config('python_zygote_preload'))
+            p = process.Process(
+                process_args=[self.source_path] + args[split + 1:] +
+                additional_args,
+                zygote=handle,
+                executable=self.__python_bytecode,
+                **kwargs
+            )
+            return p.execute()
+        if self.__python_bytecode:
+            split = args.index('{source_file}')
+            args[split:split + 1] = ['-c', python_run_script, '{source_file}',
+                                     self.__python_bytecode]
         for i in range(0, len(args)):
             args[i] = args[i].format(source_file=self.source_path)
         # Formatted arguments, executing
@@ -247,6 +571,9 @@ class PythonCompiler(Compiler):
         return p.execute()
 
     def close(self):
+        if self.__python_bytecode:
+            tmpmgmt.remove_tmpfile(self.__python_bytecode)
+            self.__python_bytecode = None
         return
     pass
 
@@ -278,6 +605,7 @@ class CLikeCompiler(Compiler):
 
     def __init__(self, source_path, language_type):
         Compiler.__init__(self, source_path)
+        self.language_type = language_type
         if language_type == 'C':
             self.__c_args = config.get_config('gcc_args')
         elif language_type == 'C++':
@@ -292,21 +620,43 @@ class CLikeCompiler(Compiler):
         args = copy.deepcopy(self.__c_args)
         out_file = tmpmgmt.create_tmpfile()
         self.__c_executable = out_file
+        # Executables are reused when source, arguments and compiler match
+        compile_cache = cache.DiskCache(
+            'compile', config.get_config('compile_cache_size'))
+        cache_key = None
+        if compile_cache.enabled():
+            cache_key = self.__cache_key(args)
+        if cache_key:
+            with compile_cache.lock():
+                if compile_cache.fetch(cache_key, out_file):
+                    return CompilerResult(return_code=0, output='')
+        pch_dir = None
+        if self.language_type == 'C++' and \
+                config.get_config('cpp_precompiled_header') and \
+                self.__includes('bits/stdc++.h'):
+            try:
+                pch_dir = get_precompiled_header(args)
+            except OSError:
+                pch_dir = None
         for i in range(0, len(args)):
             args[i] = args[i].format(
                 source_file=self.source_path,
                 output_file=out_file)
             pass
+        # Precompiled header takes the place of the original one
+        if pch_dir:
+            args.insert(1, '-I' + pch_dir)
         # Formatted arguments, executing
         proc = process.Process(
             time_limit=5000,
             memory_limit=0,
-            process_args=args
+            process_args=args,
+            output_limit=0  # Executables with static data take a lot
         )
         ret_result_old = proc.execute()
         ret_result = CompilerResult(
             return_code=ret_result_old.return_code,
-            output=ret_result_old.stderr,
+            output=ret_result_old.stderr_text,
         )
         # Some hotfixes on Windows...
         try:
@@ -316,8 +666,31 @@ class CLikeCompiler(Compiler):
         # Done compilation
         if ret_result.return_code != 0:
             raise CompilerError(ret_result.output)
+        if cache_key:
+            with compile_cache.lock():
+                compile_cache.store(cache_key, out_file)
         return ret_result
 
+    def __includes(self, header):
+        try:
+            with open(self.source_path, 'rb') as f_handle:
+                source = f_handle.read()
+        except OSError:
+            return False
+        return re.search(rb'#\s*include\s*<' + re.escape(header.encode()) +
+                         rb'>', source) is not None
+
+    def __cache_key(self, args):
+        try:
+            with open(self.source_path, 'rb') as f_handle:
+                source = f_handle.read()
+        except OSError:
+            return None
+        version = get_compiler_version(args[0])
+        if version is None:
+            return None
+        return cache.digest(source, version, *args)
+
     def execute(self, additional_args=[], **kwargs):
         proc = process.Process(
             process_args=[self.__c_executable] + additional_args,
@@ -447,6 +820,7 @@ class AdaptiveCompiler(Compiler):
                 break
             continue
         self.__actual_compiler = comp_is(source_path)
+        self.runs_program = self.__actual_compiler.runs_program
         return
 
     def compile(self, *args, **kwargs):
@@ -457,4 +831,10 @@ class AdaptiveCompiler(Compiler):
 
     def close(self, *args, **kwargs):
         return self.__actual_compiler.close(*args, **kwargs)
+
+    def seek(self, *args, **kwargs):
+        return self.__actual_compiler.seek(*args, **kwargs)
+
+    def case_numbers(self, *args, **kwargs):
+        return self.__actual_compiler.case_numbers(*args, **kwargs)
     pass
@@ -16,14 +16,36 @@ Others would be implemented by this module.
 __configs = {
     # 'tmp_dir': 'C:/Users/Administrator/AppData/Local/Temp/PyJudgeTemp/',
     'tmp_dir': './PyJudgeTemp/',
+    'cache_dir': './PyJudgeCache/',
+    'compile_cache_size': 256*1024*1024,  # 256 MB of cached executables
+    'input_cache_size': 256*1024*1024,  # 256 MB of inputs generated by seed
+    'std_cache': 'memory',  # Reuse standard outputs, 'memory', 'disk' or None
+    'std_cache_size': 64*1024*1024,  # 64 MB of cached standard outputs
     'max_output': 64*1024*1024,  # 64 MB Maximum allowed output
+    'mapped_file_size': 1024*1024,  # 1 MB outputs or inputs and up mapped
+    'prefetch_cases': 2,  # Following cases read ahead in directory mode
+    'prefetch_size': 64*1024*1024,  # 64 MB read ahead at most per file
+    'cgroup_root': None,  # Delegated cgroup v2 directory to account memory
+    'cgroup_pool_size': 4,  # cgroups created ahead of time and reused
+    'cgroup_pids_max': 64,  # Maximum processes and threads in a cgroup
+    'cgroup_cpu_max': '100000 100000',  # CPU bandwidth, 'quota period' in us
+    'time_limit_policy': 'wall',  # Time limited, 'wall' clock or 'cpu' time
+    'wall_time_ratio': 3,  # Wall clock limit in times of CPU time limits
+    'address_space_ratio': 16,  # RLIMIT_AS in times of memory limits
+    'checker_time_limit': 10000,  # 10 seconds per check of testlib checkers
+    'checker_memory_limit': 1024*1024*1024,  # 1 GB for testlib checkers
     'table_max_lines': 20,
     'table_max_linewidth': 256,
     'gcc_args': ['gcc', '-O2', '-o', '{output_file}', '{source_file}'],
     'g++_args': ['g++', '-O2', '-o', '{output_file}', '{source_file}'],
+    'cpp_precompiled_header': True,  # Precompile <bits/stdc++.h> for G++
     'fpc_args': ['fpc', '{source_file}', '-o{output_file}'],
     'python2_args': ['python2', '{source_file}'],
     'python3_args': ['python3', '{source_file}'],
+    'python_zygote': False,  # Fork Python 3 programs from a warm interpreter
+    'python_zygote_preload': ['collections', 'math', 're', 'heapq', 'bisect',
+                              'itertools', 'functools', 'random', 'fractions',
+                              'decimal'],
     'javac_args': ['javac'],
 }
 
@@ -1,12 +1,23 @@
 import binascii
+import concurrent.futures
 import copy
 import hashlib
+import os
+import pickle
 import random
+import select
+import signal
+import threading
+import time
 
+from . import cache
 from . import compiler
 from . import config
 from . import process
 from . import table
+from . import tmpmgmt
+from . import watchdog
+from .checker import TestlibChecker, create_checker
 
 
 class JudgerError(Exception):
@@ -26,7 +37,8 @@ class JudgerResult:
                  out_compile_result=compiler.CompilerResult(),
                  out_execute_result=process.ProcessResult(),
                  stdout_compile_result=compiler.CompilerResult(),
-                 stdout_execute_result=process.ProcessResult()):
+                 stdout_execute_result=process.ProcessResult(),
+                 judge_message=''):
         self.judge_result = judge_result
         self.input_compile_result = input_compile_result
         self.input_execute_result = input_execute_result
@@ -34,29 +46,33 @@ class JudgerResult:
         self.out_execute_result = out_execute_result
         self.stdout_compile_result = stdout_compile_result
         self.stdout_execute_result = stdout_execute_result
+        self.judge_message = judge_message
         return
 
     def __repr__(self):
         table_list = [
             ('Judge Result', status_codes[self.judge_result]),
             ('Execution Time', self.out_execute_result.time),
+            ('CPU Time', self.out_execute_result.cpu_time),
             ('Std Run Time', self.stdout_execute_result.time),
             ('Memory Cost', self.out_execute_result.memory),
             ('Return Code', self.out_execute_result.return_code),
             ('Compiler Output', self.out_compile_result.output),
         ]
+        if self.judge_message:
+            table_list.append(('Judge Message', self.judge_message))
         if self.judge_result == 'IJI':
             table_list += [
                 ('Input Compiler', self.input_compile_result.output),
-                ('Input', self.input_execute_result.stdout),
+                ('Input', self.input_execute_result.stdout_text),
             ]
         elif self.judge_result in {'CE', 'AC'}:
             pass
         else:
             table_list += [
-                ('Input', self.input_execute_result.stdout),
-                ('Output', self.out_execute_result.stdout),
-                ('Standard Output', self.stdout_execute_result.stdout),
+                ('Input', self.input_execute_result.stdout_text),
+                ('Output', self.out_execute_result.stdout_text),
+                ('Standard Output', self.stdout_execute_result.stdout_text),
             ]
         return repr(table.Table('Judge Results', table_list))
         pass
@@ -68,7 +84,8 @@ class JudgerResult:
               out_compile_result=None,
               out_execute_result=None,
               stdout_compile_result=None,
-              stdout_execute_result=None):
+              stdout_execute_result=None,
+              judge_message=None):
         """ Create a clone of oneself, not mutating the original properties. """
         return JudgerResult(
             judge_result=copy.deepcopy(judge_result or self.judge_result),
@@ -82,34 +99,39 @@ class JudgerResult:
                 out_execute_result or self.out_execute_result),
             stdout_compile_result=copy.deepcopy(
                 stdout_compile_result or self.stdout_compile_result),
-            stdout_execute_result=copy.deepcopy(stdout_execute_result or self.stdout_execute_result))
+            stdout_execute_result=copy.deepcopy(stdout_execute_result or self.stdout_execute_result),
+            judge_message=judge_message or self.judge_message)
         pass
 
     def hash(self):
-        str_concat = ('random:%f | judge:%s | input:%d-%s-%f-%d-%s-%s | stdout:%d-%s-%f-%d-%s-%s | out:%d-%s-%f-%d-%s-%s' % (
+        hasher = hashlib.sha256()
+        hasher.update(('random:%f | judge:%s | input:%d-%s-%f-%d | stdout:%d-%s-%f-%d | out:%d-%s-%f-%d' % (
             random.random(),
             self.judge_result,
             self.input_compile_result.return_code,
             self.input_compile_result.output,
             self.input_execute_result.time,
             self.input_execute_result.memory,
-            self.input_execute_result.stdout,
-            self.input_execute_result.stderr,
             self.stdout_compile_result.return_code,
             self.stdout_compile_result.output,
             self.stdout_execute_result.time,
             self.stdout_execute_result.memory,
-            self.stdout_execute_result.stdout,
-            self.stdout_execute_result.stderr,
             self.out_compile_result.return_code,
             self.out_compile_result.output,
             self.out_execute_result.time,
             self.out_execute_result.memory,
-            self.out_execute_result.stdout,
-            self.out_execute_result.stderr,
-        )).encode('utf-8', 'ignore')
-        str_hash = binascii.hexlify(hashlib.sha256(
-            str_concat).digest()).decode('utf-8')
+        )).encode('utf-8', 'ignore'))
+        # Outputs are hashed as they are, without decoding
+        for result in [self.input_execute_result,
+                       self.stdout_execute_result,
+                       self.out_execute_result]:
+            for data in [result.stdout, result.stderr]:
+                if type(data) == str:
+                    data = data.encode('utf-8', 'ignore')
+                hasher.update(data)
+                continue
+            continue
+        str_hash = binascii.hexlify(hasher.digest()).decode('utf-8')
         return str_hash
     pass
 
@@ -154,6 +176,147 @@ def wrap_judger(input_class):
     return JudgerWrapper
 
 
+def compile_concurrently(compiles):
+    """ compile_concurrently(compiles) -- Invoke compile functions at once,
+    each in a thread of its own, skipping those given as None. Returns their
+    CompilerResult (None if skipped) in the same order, or the CompilerError
+    raised where failed. """
+    def __compile(func):
+        if func is None:
+            return None
+        try:
+            return func()
+        except compiler.CompilerError as err:
+            return err
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(len(compiles), 1)) as executor:
+        return list(executor.map(__compile, compiles))
+
+
+def match_cases(input_handle, stdout_handle):
+    """ match_cases(input_handle, stdout_handle) -- Checks that numbered
+    cases of compiled input and standard output handles pair up by number.
+    Returns a message naming the numbers found on one side only, None if
+    they match or either handle is not numbered. """
+    input_numbers = input_handle.case_numbers()
+    stdout_numbers = stdout_handle.case_numbers()
+    if input_numbers is None or stdout_numbers is None or \
+            input_numbers == stdout_numbers:
+        return None
+    messages = []
+    for title, numbers in [
+            ('input only', set(input_numbers) - set(stdout_numbers)),
+            ('output only', set(stdout_numbers) - set(input_numbers))]:
+        if numbers:
+            messages.append('%s %s' % (title, ', '.join(
+                str(number) for number in sorted(numbers))))
+        continue
+    return 'Unmatched test cases: ' + '; '.join(messages)
+
+
+def generate_input(input_handle, seed=None):
+    """ generate_input(input_handle, seed) -- Runs the input handle, passing
+    on the seed if given. Inputs generated with a seed are kept on disk by
+    the source of the generator and the seed, and reused afterwards without
+    running the generator, which must therefore be deterministic. Cases of
+    multi-case generators are not kept, as they differ on every call. """
+    args = [str(seed)] if seed else []
+    input_cache = cache.DiskCache(
+        'input', config.get_config('input_cache_size'))
+    if not args or not input_handle.runs_program or not input_cache.enabled() \
+            or isinstance(input_handle, compiler.MultiCaseCompiler):
+        return input_handle.execute(additional_args=args)
+    identity = cache.digest_file(input_handle.source_path)
+    if identity is None:
+        return input_handle.execute(additional_args=args)
+    cache_key = cache.digest(identity, *args)
+    with input_cache.lock():
+        data = input_cache.load(cache_key)
+    if data is not None:
+        return pickle.loads(data)
+    ret = input_handle.execute(additional_args=args)
+    if ret.return_code != 0:
+        return ret
+    with input_cache.lock():
+        input_cache.save(cache_key, pickle.dumps(ret))
+    return ret
+
+
+def export_tests(results, directory, name='data'):
+    """ export_tests(results, directory, name) -- Freeze inputs and standard
+    outputs of judged results into test data, written as '<name><n>.in' and
+    '<name><n>.ans' from 1 on, which are read back as '<name>.in*' and
+    '<name>.ans*'. Results where input or standard output did not run
+    successfully are left out, e.g. of invalid input or submissions failing
+    to compile. Streamed inputs are only there if the judger retained them
+    (see retain_input). Returns the count of tests written. """
+    os.makedirs(directory, exist_ok=True)
+    count = 0
+    for j_result in results:
+        if j_result.input_execute_result.return_code != 0 or \
+                j_result.stdout_execute_result.return_code != 0:
+            continue
+        count += 1
+        for suffix, data in [
+                ('in', j_result.input_execute_result.stdout),
+                ('ans', j_result.stdout_execute_result.stdout)]:
+            if type(data) == str:
+                data = data.encode('utf-8')
+            path = os.path.join(directory, '%s%d.%s' % (name, count, suffix))
+            with open(path, 'wb') as f_handle:
+                f_handle.write(data)
+            continue
+        continue
+    return count
+
+
+def execute_on_input(handle, input_result, stdin, **kwargs):
+    """ execute_on_input(handle, input_result, stdin, ...) -- Runs the handle
+    on the input. Programs read the input file itself where there is one
+    ending with a newline, so that its data is never copied through this
+    process, the file is closed once they are done. Otherwise the stdin
+    chunks are passed on. """
+    path = input_result.stdout_path
+    data = input_result.stdout
+    stdin_file = None
+    if handle.runs_program and path and os.name == 'posix' and \
+            data[-1:] == b'\n':
+        try:
+            stdin_file = open(path, 'rb')
+        except OSError:
+            pass
+    try:
+        return handle.execute(stdin=stdin_file or stdin, **kwargs)
+    finally:
+        if stdin_file:
+            stdin_file.close()
+
+
+def check_result(j_result, checker, time_limit, memory_limit):
+    """ check_result(j_result, checker, time_limit, memory_limit) -- Judge
+    the user program in j_result upon its limits, then its output through
+    the checker. Returns a clone of j_result with the verdict. """
+    # Pretended delimitations
+    expected_out = j_result.out_execute_result
+    if expected_out.time == time_limit > 0:
+        return j_result.clone(judge_result='TLE')
+    if expected_out.memory == memory_limit > 0:
+        return j_result.clone(judge_result='MLE')
+    if len(expected_out.stdout) >= config.get_config('max_output'):
+        return j_result.clone(judge_result='OLE')
+    if len(expected_out.stderr) >= config.get_config('max_output'):
+        return j_result.clone(judge_result='OLE')
+    if expected_out.return_code != 0:
+        return j_result.clone(judge_result='RE')
+    # Done delimitating, now checking result
+    checker_result = checker.check(
+        j_result.input_execute_result.stdout,
+        j_result.out_execute_result.stdout,
+        j_result.stdout_execute_result.stdout)
+    return j_result.clone(judge_result=checker_result.judge_result,
+                          judge_message=checker_result.message)
+
+
 @wrap_judger
 class Judger:
     """ Base judger, always returns NotImplementedError on all actions. Extend
@@ -186,6 +349,21 @@ class DataComparisonJudger(Judger):
         out_handle : User output handle
         stdout_handle : Handle of standard output
         seed : Random seed, randomize if not given
+        parallel : Run standard and user programs concurrently, each pinned to
+                a CPU of its own when available
+        pipeline : Stream generated input into standard and user programs as
+                it is produced, rather than after the generator exits
+        retain_input : Keep a copy of streamed input in the result, default to
+                true
+        checker : Checker deciding on outputs, either a Checker or its name as
+                accepted by checker.create_checker(). Default to 'tokens'
+
+    judge() takes an optional test_id, selecting the case of multi-case inputs
+    (e.g. directories) independently of previous calls.
+
+    In pipeline mode, all three programs run at once and their wall times
+    include waiting for the generator. It applies to generated input only on
+    POSIX systems, other inputs are judged as usual.
 
     Used to judge I/O from local files. """
 
@@ -193,7 +371,11 @@ class DataComparisonJudger(Judger):
                  input_handle=None,
                  out_handle=None,
                  stdout_handle=None,
-                 seed=None):
+                 seed=None,
+                 parallel=False,
+                 pipeline=False,
+                 retain_input=True,
+                 checker=None):
         if not input_handle:
             raise AttributeError('Must provide input handle')
         if not out_handle:
@@ -216,117 +398,712 @@ class DataComparisonJudger(Judger):
             self.stdout_handle_is_temp = True
         else:
             self.stdout_handle_is_temp = False
+        if checker is None:
+            checker = 'tokens'
+        if type(checker) == str:
+            checker = create_checker(checker)
+            self.checker_is_temp = True
+        else:
+            self.checker_is_temp = False
         self.input_handle = input_handle
         self.out_handle = out_handle
         self.stdout_handle = stdout_handle
+        self.checker = checker
         self.seed = seed
-        # Precompiling input
+        # Standard program would run in background, on a different CPU
+        self.parallel = parallel
+        self.pipeline = pipeline and os.name == 'posix'
+        self.retain_input = retain_input or checker.needs_input
+        self.executor = None
+        if parallel or self.pipeline:
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=3)
+        # Standard outputs are reused on identical input
+        std_cache = config.get_config('std_cache')
+        std_cache_size = config.get_config('std_cache_size')
+        self.stdout_cache = None
+        self.stdout_identity = ''
+        if std_cache == 'memory':
+            self.stdout_cache = cache.MemoryCache(std_cache_size)
+        elif std_cache == 'disk':
+            self.stdout_cache = cache.DiskCache('std', std_cache_size)
+            self.stdout_identity = cache.digest_file(
+                self.stdout_handle.source_path)
+        if not self.stdout_handle.runs_program or \
+                self.stdout_identity is None or \
+                (self.stdout_cache and not self.stdout_cache.enabled()):
+            self.stdout_cache = None
+        # Precompiling input, stdout, checker and user program at once, where
+        # failures are reported in this order
         self.j_result = JudgerResult(judge_result='AC')
-        try:
-            if not self.input_handle.compiled():
-                self.j_result.input_compile_result = self.input_handle.compile()
-        except compiler.CompilerError as err:
+        input_ret, stdout_ret, checker_ret, out_ret = compile_concurrently([
+            None if self.input_handle.compiled() else self.input_handle.compile,
+            None if self.stdout_handle.compiled() else self.stdout_handle.compile,
+            self.checker.compile,
+            None if self.out_handle.compiled() else self.out_handle.compile,
+        ])
+        if isinstance(input_ret, compiler.CompilerError):
             self.j_result.judge_result = 'IJI'
             self.j_result.input_compile_result = compiler.CompilerResult(
-                output=err.args[0])
+                output=input_ret.args[0])
             return
-        # Precompiling stdout
-        try:
-            if not self.stdout_handle.compiled():
-                self.j_result.stdout_compile_result = self.stdout_handle.compile()
-        except compiler.CompilerError as err:
+        if input_ret:
+            self.j_result.input_compile_result = input_ret
+        if isinstance(stdout_ret, compiler.CompilerError):
             self.j_result.judge_result = 'IJI'
             self.j_result.stdout_compile_result = compiler.CompilerResult(
-                output=err.args[0])
+                output=stdout_ret.args[0])
             return
-        # Precompiling user program
-        try:
-            if not self.out_handle.compiled():
-                self.j_result.out_compile_result = self.out_handle.compile()
-        except compiler.CompilerError as err:
+        if stdout_ret:
+            self.j_result.stdout_compile_result = stdout_ret
+        cases_message = match_cases(self.input_handle, self.stdout_handle)
+        if cases_message:
+            self.j_result.judge_result = 'IJI'
+            self.j_result.judge_message = cases_message
+            return
+        if isinstance(checker_ret, compiler.CompilerError):
+            self.j_result.judge_result = 'IJI'
+            self.j_result.judge_message = 'Checker compile error: ' + \
+                checker_ret.args[0]
+            return
+        if isinstance(out_ret, compiler.CompilerError):
             self.j_result.judge_result = 'CE'
             self.j_result.out_compile_result = compiler.CompilerResult(
-                output=err.args[0])
+                output=out_ret.args[0])
             return
+        if out_ret:
+            self.j_result.out_compile_result = out_ret
         # Compile success
         return
 
-    def judge(self, time_limit=0, memory_limit=0):
+    def judge(self, time_limit=0, memory_limit=0, test_id=None):
         # Checking pre-compile errors:
         if self.j_result.judge_result != 'AC':
             return self.j_result.clone()
+        # Selecting the test explicitly, otherwise inputs proceed in turn
+        if test_id is not None:
+            self.input_handle.seek(test_id)
+            self.stdout_handle.seek(test_id)
+        # Generated input is streamed into both programs as it is produced
+        if self.pipeline and self.input_handle.runs_program:
+            ret = self.__judge_pipeline(time_limit, memory_limit)
+            if ret:
+                return ret
+            return self.__check_result(time_limit, memory_limit)
         # Running standard input
-        if self.seed:
-            self.j_result.input_execute_result = self.input_handle.execute(additional_args=[
-                                                                           self.seed])
-        else:
-            self.j_result.input_execute_result = self.input_handle.execute()
+        self.j_result.input_execute_result = generate_input(
+            self.input_handle, self.seed)
         if self.j_result.input_execute_result.return_code != 0:
             return self.j_result.clone(judge_result='IJI')
-        # Running standard output
-        self.j_result.stdout_execute_result = self.stdout_handle.execute(
-            time_limit=time_limit,
-            memory_limit=memory_limit,
-            stdin=self.j_result.input_execute_result.stdout + '\n'
+        # Input is passed on in chunks, without being copied
+        stdin = [self.j_result.input_execute_result.stdout, b'\n']
+        if self.parallel:
+            # Running standard output and user program at the same time, on
+            # CPUs this judger is allowed to use (as it might be in a worker)
+            parallel_cpus = (None, None)
+            if hasattr(os, 'sched_getaffinity'):
+                cpus = sorted(os.sched_getaffinity(0))
+                if len(cpus) >= 2:
+                    parallel_cpus = ({cpus[0]}, {cpus[1]})
+            stdout_future = self.executor.submit(
+                self.__execute_stdout,
+                time_limit=time_limit,
+                memory_limit=memory_limit,
+                stdin=stdin,
+                cpu_affinity=parallel_cpus[0]
+            )
+            self.j_result.out_execute_result = execute_on_input(
+                self.out_handle,
+                self.j_result.input_execute_result,
+                stdin,
+                time_limit=time_limit,
+                memory_limit=memory_limit,
+                cpu_affinity=parallel_cpus[1]
+            )
+            self.j_result.stdout_execute_result = stdout_future.result()
+            if self.j_result.stdout_execute_result.return_code != 0:
+                return self.j_result.clone(judge_result='IJI')
+        else:
+            # Running standard output
+            self.j_result.stdout_execute_result = self.__execute_stdout(
+                time_limit=time_limit,
+                memory_limit=memory_limit,
+                stdin=stdin
+            )
+            if self.j_result.stdout_execute_result.return_code != 0:
+                return self.j_result.clone(judge_result='IJI')
+            # Running user program
+            self.j_result.out_execute_result = execute_on_input(
+                self.out_handle,
+                self.j_result.input_execute_result,
+                stdin,
+                time_limit=time_limit,
+                memory_limit=memory_limit
+            )
+        return self.__check_result(time_limit, memory_limit)
+
+    def __judge_pipeline(self, time_limit, memory_limit):
+        """ Runs the generator with its output copied into the standard and
+        user programs through pipes, returns a result early on judge errors. """
+        gen_r, gen_w = os.pipe()
+        out_r, out_w = os.pipe()
+        destinations = [out_w]
+        std_r = None
+        if self.stdout_handle.runs_program:
+            std_r, std_w = os.pipe()
+            destinations.append(std_w)
+        retain = None
+        if self.retain_input:
+            retain = process.create_output_file()
+        max_output = config.get_config('max_output') or 0
+        tee_future = self.executor.submit(
+            process.tee, gen_r, destinations, retain=retain,
+            limit=max_output, suffix=b'\n')
+        input_future = self.executor.submit(
+            self.input_handle.execute,
+            additional_args=[str(self.seed)] if self.seed else [],
+            stdout=gen_w
         )
-        if self.j_result.stdout_execute_result.return_code != 0:
-            return self.j_result.clone(judge_result='IJI')
-        # Running user program
+        stdout_future = None
+        if std_r is not None:
+            stdout_future = self.executor.submit(
+                self.stdout_handle.execute,
+                time_limit=time_limit,
+                memory_limit=memory_limit,
+                stdin=std_r
+            )
         self.j_result.out_execute_result = self.out_handle.execute(
             time_limit=time_limit,
             memory_limit=memory_limit,
-            stdin=self.j_result.input_execute_result.stdout + '\n'
+            stdin=out_r
         )
+        if stdout_future:
+            self.j_result.stdout_execute_result = stdout_future.result()
+        input_result = input_future.result()
+        input_size = tee_future.result()
+        if retain:
+            input_result.stdout = process.map_output_file(retain)
+        self.j_result.input_execute_result = input_result
+        if input_result.return_code != 0 or 0 < max_output < input_size:
+            return self.j_result.clone(judge_result='IJI')
+        if stdout_future is None:
+            # Stored standard outputs do not depend on the input
+            self.j_result.stdout_execute_result = self.stdout_handle.execute()
+        if self.j_result.stdout_execute_result.return_code != 0:
+            return self.j_result.clone(judge_result='IJI')
+        return None
+
+    def __check_result(self, time_limit, memory_limit):
+        return check_result(self.j_result, self.checker,
+                            time_limit, memory_limit)
+
+    def __execute_stdout(self, stdin, **kwargs):
+        """ Runs the standard program, reusing results of successful runs upon
+        identical input. """
+        if not self.stdout_cache:
+            return execute_on_input(
+                self.stdout_handle, self.j_result.input_execute_result, stdin,
+                **kwargs)
+        cache_key = cache.digest(self.stdout_identity, *stdin)
+        if type(self.stdout_cache) == cache.DiskCache:
+            with self.stdout_cache.lock():
+                data = self.stdout_cache.load(cache_key)
+            if data is not None:
+                return pickle.loads(data)
+        else:
+            ret = self.stdout_cache.get(cache_key)
+            if ret is not None:
+                return ret
+        ret = execute_on_input(
+            self.stdout_handle, self.j_result.input_execute_result, stdin,
+            **kwargs)
+        if ret.return_code != 0:
+            return ret
+        if type(self.stdout_cache) == cache.DiskCache:
+            with self.stdout_cache.lock():
+                self.stdout_cache.save(cache_key, pickle.dumps(ret))
+        else:
+            self.stdout_cache.put(cache_key, ret,
+                                  len(ret.stdout) + len(ret.stderr))
+        return ret
+
+    def close(self):
+        if not self.input_handle.closed() and self.input_handle_is_temp:
+            self.input_handle.close()
+        if not self.out_handle.closed() and self.out_handle_is_temp:
+            self.out_handle.close()
+        if not self.stdout_handle.closed() and self.stdout_handle_is_temp:
+            self.stdout_handle.close()
+        if self.checker_is_temp:
+            self.checker.close()
+        if self.executor:
+            self.executor.shutdown()
+        return
+    pass
+
+
+class IdlenessWatch:
+    """ Watches programs talking through pipes for deadlocks, from the timers
+    of the watchdog where it takes the place of the process. Programs are
+    deadlocked once all of them have been waiting for input from a pipe,
+    with none pending nor any CPU time spent, for idle_limit milliseconds.
+    They are killed then, and deadlocked is set. Receives following
+    arguments:
+
+        idle_limit : Time in milliseconds programs may wait for each other.
+        pipe_fds : Read ends of the pipes between them, which are closed
+                along with the watch.
+        count : Count of programs, watching begins once all have started.
+
+    Waiting is told by the kernel where the watchdog is event-driven, other
+    platforms leave deadlocks to time limits. Watching stops as soon as any
+    program exits, so that others are not kept from a broken pipe. """
+
+    def __init__(self, idle_limit, pipe_fds, count=2):
+        self.idle_limit = idle_limit
+        self.pipe_fds = pipe_fds
+        self.count = count
+        self.stdin = None
+        self.deadlocked = False
+        self.__lock = threading.Lock()
+        self.__pids = []
+        self.__pidfds = []
+        self.__watch = None
+        self.__closed = False
+        self.__exited = False
+        self.__cpu_times = None
+        self.__idle_begin = None
+        return
+
+    def add(self, pid):
+        """ add(pid) -- Tell a program has started, to be passed as on_spawn
+        of its execution. """
+        with self.__lock:
+            if self.__closed or not process.platform_event_watchdog:
+                return
+            self.__pids.append(pid)
+            # Signals go through pidfds, immune to reuse of process IDs
+            self.__pidfds.append(os.pidfd_open(pid))
+            if len(self.__pids) == self.count:
+                self.__watch = watchdog.get_watchdog().watch(
+                    watchdog.Watch(self, sample=self.__sample))
+        return
+
+    def kill(self):
+        self.deadlocked = True
+        for pidfd in self.__pidfds:
+            try:
+                signal.pidfd_send_signal(pidfd, signal.SIGKILL)
+            except OSError:
+                pass
+            continue
+        return
+
+    def __sample(self):
+        if self.__exited or select.select(self.__pidfds, [], [], 0)[0]:
+            self.__exited = True
+            return None
+        cpu_times = [process.read_cpu_time(pid) for pid in self.__pids]
+        idle = cpu_times == self.__cpu_times and \
+            all(process.read_waiting_on_pipe(pid) for pid in self.__pids) and \
+            not any(process.read_pending_bytes(fd) for fd in self.pipe_fds)
+        self.__cpu_times = cpu_times
+        if not idle:
+            self.__idle_begin = None
+            return None
+        time_cur = time.perf_counter_ns()
+        if self.__idle_begin is None:
+            self.__idle_begin = time_cur
+        elif time_cur - self.__idle_begin >= self.idle_limit * 1000000:
+            return 'TLE'
+        return None
+
+    def close(self):
+        """ close() -- Stop watching, once the programs are reaped. """
+        with self.__lock:
+            self.__closed = True
+            watch, self.__watch = self.__watch, None
+        if watch:
+            watchdog.get_watchdog().unwatch(watch)
+            watch.done.wait()
+        for fd in self.pipe_fds + self.__pidfds:
+            os.close(fd)
+            continue
+        return
+    pass
+
+
+@wrap_judger
+class InteractiveJudger(Judger):
+    """ Judges programs interacting with an interactor, which talk through
+    each other's standard input and output. Receives following arguments at
+    initialization:
+
+        interactor_handle : Handle of interactor, invoked as 'interactor
+                <input> <output>' with testlib exit codes
+        out_handle : User program handle
+        input_handle : Input handle, its data is passed to the interactor in
+                a file. Default to none, where the file is empty
+        seed : Random seed, passed on to generated input
+        idle_limit : Time in milliseconds both programs may wait for each
+                other's output, before being considered deadlocked
+
+    Both programs are connected with pipes directly, so that queries never
+    pass through the judger. Each is accounted in its own result, where the
+    interactor takes the place of standard output. The interactor is allowed
+    twice the time limit, as both spend their time waiting for each other.
+    Deadlocks are judged as TLE. """
+
+    def __init__(self,
+                 interactor_handle=None,
+                 out_handle=None,
+                 input_handle=None,
+                 seed=None,
+                 idle_limit=100):
+        if not interactor_handle:
+            raise AttributeError('Must provide interactor handle')
+        if not out_handle:
+            raise AttributeError('Must provide output handle')
+        # Building compilers, in case they haven't been built
+        self.input_handle_is_temp = False
+        if type(input_handle) == str:
+            input_handle = compiler.AdaptiveCompiler(input_handle)
+            self.input_handle_is_temp = True
+        if type(interactor_handle) == str:
+            interactor_handle = compiler.AdaptiveCompiler(interactor_handle)
+            self.interactor_handle_is_temp = True
+        else:
+            self.interactor_handle_is_temp = False
+        if type(out_handle) == str:
+            out_handle = compiler.AdaptiveCompiler(out_handle)
+            self.out_handle_is_temp = True
+        else:
+            self.out_handle_is_temp = False
+        if not interactor_handle.runs_program or not out_handle.runs_program:
+            raise AttributeError('Interactor and user code must be programs')
+        self.input_handle = input_handle
+        self.interactor_handle = interactor_handle
+        self.out_handle = out_handle
+        self.seed = seed
+        self.idle_limit = idle_limit
+        # Running interactor in background
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        # Precompiling input, interactor and user program at once, where
+        # failures are reported in this order
+        self.j_result = JudgerResult(judge_result='AC')
+        input_ret, interactor_ret, out_ret = compile_concurrently([
+            self.input_handle.compile if self.input_handle and
+            not self.input_handle.compiled() else None,
+            None if self.interactor_handle.compiled() else
+            self.interactor_handle.compile,
+            None if self.out_handle.compiled() else self.out_handle.compile,
+        ])
+        if isinstance(input_ret, compiler.CompilerError):
+            self.j_result.judge_result = 'IJI'
+            self.j_result.input_compile_result = compiler.CompilerResult(
+                output=input_ret.args[0])
+            return
+        if input_ret:
+            self.j_result.input_compile_result = input_ret
+        if isinstance(interactor_ret, compiler.CompilerError):
+            self.j_result.judge_result = 'IJI'
+            self.j_result.stdout_compile_result = compiler.CompilerResult(
+                output=interactor_ret.args[0])
+            return
+        if interactor_ret:
+            self.j_result.stdout_compile_result = interactor_ret
+        if isinstance(out_ret, compiler.CompilerError):
+            self.j_result.judge_result = 'CE'
+            self.j_result.out_compile_result = compiler.CompilerResult(
+                output=out_ret.args[0])
+            return
+        if out_ret:
+            self.j_result.out_compile_result = out_ret
+        # Compile success
+        return
+
+    def judge(self, time_limit=0, memory_limit=0, test_id=None):
+        # Checking pre-compile errors:
+        if self.j_result.judge_result != 'AC':
+            return self.j_result.clone()
+        # Running standard input, which the interactor reads from a file
+        input_data = b''
+        if self.input_handle:
+            if test_id is not None:
+                self.input_handle.seek(test_id)
+            self.j_result.input_execute_result = generate_input(
+                self.input_handle, self.seed)
+            if self.j_result.input_execute_result.return_code != 0:
+                return self.j_result.clone(judge_result='IJI')
+            input_data = self.j_result.input_execute_result.stdout
+        input_path = tmpmgmt.create_tmpfile()
+        output_path = tmpmgmt.create_tmpfile()
+        try:
+            with open(input_path, 'wb') as f_handle:
+                if type(input_data) == str:
+                    input_data = input_data.encode('utf-8')
+                f_handle.write(input_data)
+            deadlocked = self.__interact(
+                time_limit, memory_limit, input_path, output_path)
+        finally:
+            tmpmgmt.remove_tmpfile(input_path)
+            tmpmgmt.remove_tmpfile(output_path)
         # Pretended delimitations
+        if deadlocked:
+            return self.j_result.clone(
+                judge_result='TLE',
+                judge_message='Idleness limit exceeded, both programs were '
+                'waiting for input')
         expected_out = self.j_result.out_execute_result
         if expected_out.time == time_limit > 0:
             return self.j_result.clone(judge_result='TLE')
         if expected_out.memory == memory_limit > 0:
             return self.j_result.clone(judge_result='MLE')
-        if len(expected_out.stdout) >= config.get_config('max_output'):
-            return self.j_result.clone(judge_result='OLE')
         if len(expected_out.stderr) >= config.get_config('max_output'):
             return self.j_result.clone(judge_result='OLE')
+        # Interactor verdicts come first, as the user program may well have
+        # been broken off by the interactor leaving
+        interactor_out = self.j_result.stdout_execute_result
+        message = interactor_out.stderr_text.strip()
+        if interactor_out.time == time_limit * 2 > 0 or \
+                interactor_out.return_code not in TestlibChecker.exit_codes:
+            return self.j_result.clone(judge_result='IJI', judge_message=message)
+        judge_result = TestlibChecker.exit_codes[interactor_out.return_code]
+        if judge_result != 'AC':
+            return self.j_result.clone(judge_result=judge_result,
+                                       judge_message=message)
         if expected_out.return_code != 0:
             return self.j_result.clone(judge_result='RE')
-        # Done delimitating, now checking result
-
-        def __strip_down(s_in, flag):
-            lout = list()
-            for i in s_in:
-                if len(i) <= 0:
-                    continue
-                lin = i.split(flag)
-                for j in lin:
-                    if len(j) > 0:
-                        lout.append(j)
-                continue
-            return lout
-
-        def __strip_down_all(s_in):
-            s_in = [s_in]
-            for i in ' \t\r\n':
-                s_in = __strip_down(s_in, i)
-            return s_in
-        out_s = self.j_result.out_execute_result.stdout
-        stdout_s = self.j_result.stdout_execute_result.stdout
-        out_l = __strip_down_all(out_s)
-        stdout_l = __strip_down_all(stdout_s)
-        if out_l != stdout_l:
-            return self.j_result.clone(judge_result='WA')
-        # Answer correct, checking presentation errors
-        check_presentation_errors = False
-        if check_presentation_errors:
-            if out_s != stdout_s:
-                return self.j_result.clone(judge_result='PE')
-        return self.j_result.clone()
+        return self.j_result.clone(judge_message=message)
+
+    def __interact(self, time_limit, memory_limit, input_path, output_path):
+        """ Runs the user program and the interactor connected to each other,
+        returns whether they were killed upon deadlock. """
+        user_r, interactor_w = os.pipe()
+        interactor_r, user_w = os.pipe()
+        # Read ends are duplicated to tell whether any input is pending
+        idleness = IdlenessWatch(
+            self.idle_limit, [os.dup(user_r), os.dup(interactor_r)])
+        interactor_future = self.executor.submit(
+            self.interactor_handle.execute,
+            additional_args=[input_path, output_path],
+            time_limit=time_limit * 2,
+            stdin=interactor_r,
+            stdout=interactor_w,
+            on_spawn=idleness.add
+        )
+        try:
+            self.j_result.out_execute_result = self.out_handle.execute(
+                time_limit=time_limit,
+                memory_limit=memory_limit,
+                stdin=user_r,
+                stdout=user_w,
+                on_spawn=idleness.add
+            )
+            self.j_result.stdout_execute_result = interactor_future.result()
+        finally:
+            idleness.close()
+        return idleness.deadlocked
 
     def close(self):
-        if not self.input_handle.closed() and self.input_handle_is_temp:
+        if self.input_handle and not self.input_handle.closed() and \
+                self.input_handle_is_temp:
             self.input_handle.close()
+        if not self.interactor_handle.closed() and \
+                self.interactor_handle_is_temp:
+            self.interactor_handle.close()
         if not self.out_handle.closed() and self.out_handle_is_temp:
             self.out_handle.close()
+        self.executor.shutdown()
+        return
+    pass
+
+
+@wrap_judger
+class BatchJudger(Judger):
+    """ Judges many submissions against one problem, where input and standard
+    output are produced once per test and shared by all submissions. Receives
+    following arguments at initialization:
+
+        input_handle : Input file handle
+        out_handles : List of user program handles
+        stdout_handle : Handle of standard output
+        seed : Random seed, randomize if not given
+        checker : Checker deciding on outputs, either a Checker or its name as
+                accepted by checker.create_checker(). Default to 'tokens'
+        jobs : Count of submissions run at once, default to 1
+
+    All sources are compiled at once. judge() takes the same arguments as
+    DataComparisonJudger.judge(), returning a list of JudgerResult in the
+    order of out_handles. """
+
+    def __init__(self,
+                 input_handle=None,
+                 out_handles=None,
+                 stdout_handle=None,
+                 seed=None,
+                 checker=None,
+                 jobs=1):
+        if not input_handle:
+            raise AttributeError('Must provide input handle')
+        if not out_handles:
+            raise AttributeError('Must provide output handles')
+        if not stdout_handle:
+            raise AttributeError('Must provide standard output handle')
+        # Building compilers, in case they haven't been built
+        if type(input_handle) == str:
+            input_handle = compiler.AdaptiveCompiler(input_handle)
+            self.input_handle_is_temp = True
+        else:
+            self.input_handle_is_temp = False
+        self.out_handles_are_temp = [type(handle) == str
+                                     for handle in out_handles]
+        out_handles = [compiler.AdaptiveCompiler(handle)
+                       if type(handle) == str else handle
+                       for handle in out_handles]
+        if type(stdout_handle) == str:
+            stdout_handle = compiler.AdaptiveCompiler(stdout_handle)
+            self.stdout_handle_is_temp = True
+        else:
+            self.stdout_handle_is_temp = False
+        if checker is None:
+            checker = 'tokens'
+        if type(checker) == str:
+            checker = create_checker(checker)
+            self.checker_is_temp = True
+        else:
+            self.checker_is_temp = False
+        self.input_handle = input_handle
+        self.out_handles = out_handles
+        self.stdout_handle = stdout_handle
+        self.checker = checker
+        self.seed = seed
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(jobs, 1))
+        # Precompiling everything at once, where failures of input, stdout
+        # and checker are reported in this order on every submission
+        self.j_result = JudgerResult(judge_result='AC')
+        compile_results = compile_concurrently([
+            None if self.input_handle.compiled() else self.input_handle.compile,
+            None if self.stdout_handle.compiled() else self.stdout_handle.compile,
+            self.checker.compile,
+        ] + [None if handle.compiled() else handle.compile
+             for handle in self.out_handles])
+        input_ret, stdout_ret, checker_ret = compile_results[:3]
+        self.out_j_results = []
+        for out_ret in compile_results[3:]:
+            out_j_result = JudgerResult(judge_result='AC')
+            if isinstance(out_ret, compiler.CompilerError):
+                out_j_result.judge_result = 'CE'
+                out_j_result.out_compile_result = compiler.CompilerResult(
+                    output=out_ret.args[0])
+            elif out_ret:
+                out_j_result.out_compile_result = out_ret
+            self.out_j_results.append(out_j_result)
+            continue
+        if isinstance(input_ret, compiler.CompilerError):
+            self.j_result.judge_result = 'IJI'
+            self.j_result.input_compile_result = compiler.CompilerResult(
+                output=input_ret.args[0])
+            return
+        if input_ret:
+            self.j_result.input_compile_result = input_ret
+        if isinstance(stdout_ret, compiler.CompilerError):
+            self.j_result.judge_result = 'IJI'
+            self.j_result.stdout_compile_result = compiler.CompilerResult(
+                output=stdout_ret.args[0])
+            return
+        if stdout_ret:
+            self.j_result.stdout_compile_result = stdout_ret
+        cases_message = match_cases(self.input_handle, self.stdout_handle)
+        if cases_message:
+            self.j_result.judge_result = 'IJI'
+            self.j_result.judge_message = cases_message
+            return
+        if isinstance(checker_ret, compiler.CompilerError):
+            self.j_result.judge_result = 'IJI'
+            self.j_result.judge_message = 'Checker compile error: ' + \
+                checker_ret.args[0]
+            return
+        # Compile success
+        return
+
+    def judge(self, time_limit=0, memory_limit=0, test_id=None):
+        # Checking pre-compile errors of the problem
+        if self.j_result.judge_result != 'AC':
+            return self.__fail_all(self.j_result)
+        # Selecting the test explicitly, otherwise inputs proceed in turn
+        if test_id is not None:
+            self.input_handle.seek(test_id)
+            self.stdout_handle.seek(test_id)
+        # Running standard input and output once for all submissions
+        j_result = self.j_result.clone()
+        j_result.input_execute_result = generate_input(
+            self.input_handle, self.seed)
+        if j_result.input_execute_result.return_code != 0:
+            return self.__fail_all(j_result)
+        stdin = [j_result.input_execute_result.stdout, b'\n']
+        j_result.stdout_execute_result = execute_on_input(
+            self.stdout_handle,
+            j_result.input_execute_result,
+            stdin,
+            time_limit=time_limit,
+            memory_limit=memory_limit
+        )
+        if j_result.stdout_execute_result.return_code != 0:
+            return self.__fail_all(j_result)
+        # Running submissions against the shared results
+        futures = []
+        for i in range(0, len(self.out_handles)):
+            futures.append(self.executor.submit(
+                self.__judge_submission, i, j_result, stdin,
+                time_limit, memory_limit))
+            continue
+        return [future.result() for future in futures]
+
+    def __judge_submission(self, index, j_result, stdin, time_limit,
+                           memory_limit):
+        j_result = self.__merge(j_result, self.out_j_results[index])
+        if j_result.judge_result != 'AC':
+            return j_result
+        j_result.out_execute_result = execute_on_input(
+            self.out_handles[index],
+            j_result.input_execute_result,
+            stdin,
+            time_limit=time_limit,
+            memory_limit=memory_limit
+        )
+        return check_result(j_result, self.checker, time_limit, memory_limit)
+
+    def __fail_all(self, j_result):
+        """ Results of all submissions upon failures of the problem. """
+        return [self.__merge(j_result, out_j_result).clone(judge_result='IJI')
+                for out_j_result in self.out_j_results]
+
+    def __merge(self, j_result, out_j_result):
+        """ Results of the problem, with the verdict and compilation of the
+        submission. """
+        return JudgerResult(
+            judge_result=out_j_result.judge_result,
+            input_compile_result=j_result.input_compile_result,
+            input_execute_result=j_result.input_execute_result,
+            out_compile_result=out_j_result.out_compile_result,
+            out_execute_result=out_j_result.out_execute_result,
+            stdout_compile_result=j_result.stdout_compile_result,
+            stdout_execute_result=j_result.stdout_execute_result,
+            judge_message=j_result.judge_message)
+
+    def close(self):
+        if not self.input_handle.closed() and self.input_handle_is_temp:
+            self.input_handle.close()
+        for handle, is_temp in zip(self.out_handles, self.out_handles_are_temp):
+            if not handle.closed() and is_temp:
+                handle.close()
+            continue
         if not self.stdout_handle.closed() and self.stdout_handle_is_temp:
             self.stdout_handle.close()
+        if self.checker_is_temp:
+            self.checker.close()
+        self.executor.shutdown()
         return
     pass
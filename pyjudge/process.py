@@ -1,11 +1,19 @@
-import concurrent.futures
+import math
+import mmap
+import select
+import signal
+import struct
 import subprocess
 import psutil
 import time
 import sys
 import os
 
+from . import cgroup
+from . import config
 from . import table
+from . import tmpmgmt
+from . import watchdog
 
 # http://stackoverflow.com/questions/24130623/using-python-subprocess-popen-cant-prevent-exe-stopped-working-prompt
 if sys.platform.startswith('win'):
@@ -15,32 +23,138 @@ if sys.platform.startswith('win'):
     CREATE_NO_WINDOW = 0x08000000  # From Windows API
     platform_subprocess_flags = CREATE_NO_WINDOW
 else:
+    import fcntl
+    import resource
+    import termios
     platform_subprocess_flags = 0
 
+# Linux offers primitives to wait on a child without spinning: a pidfd becomes
+# readable when the child terminates and wait4 reports its resource usage.
+# Other platforms fall back to sampling the child through psutil.
+platform_event_watchdog = sys.platform.startswith('linux') and \
+    hasattr(os, 'pidfd_open') and hasattr(os, 'wait4')
+
+# Under RLIMIT_AS an oversized allocation fails instead of growing the resident
+# set, and the runtime aborts with one of these messages instead. The address
+# space is capped at 'address_space_ratio' times of the memory limit, so that
+# only allocations far beyond the limit fail, the resident set decides MLE.
+allocation_failure_markers = [
+    b'std::bad_alloc',  # C++
+    b'MemoryError',  # Python
+    b'Runtime error 203',  # Free Pascal, heap overflow
+]
+
+
+def decode_output(data):
+    """ Decodes raw process output into text, dropping carriage returns. """
+    if type(data) != str:
+        data = str(data, 'utf-8', 'ignore')
+    return data.replace('\r', '')
+
+
+def create_output_file():
+    """ Creates a temporary file for the output of a process. """
+    return open(tmpmgmt.create_tmpfile(), 'w+b')
+
+
+def map_file(f_handle):
+    """ Contents of the file, mapped read-only into memory on POSIX systems
+    where it takes at least 'mapped_file_size' bytes, otherwise read as bytes.
+    Mappings stay valid once the file is closed, though before Python 3.13
+    each keeps a descriptor of its own open until dropped. """
+    size = os.fstat(f_handle.fileno()).st_size
+    min_size = max(config.get_config('mapped_file_size') or 0, 1)
+    if os.name != 'posix' or size < min_size:
+        f_handle.seek(0)
+        return f_handle.read()
+    if sys.version_info >= (3, 13):
+        return mmap.mmap(f_handle.fileno(), 0, access=mmap.ACCESS_READ,
+                         trackfd=False)
+    return mmap.mmap(f_handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def map_output_file(f_handle):
+    """ Contents of the output file as by map_file(), then closes and removes
+    it. On POSIX systems the mapping stays valid after removal. """
+    data = map_file(f_handle)
+    discard_output_file(f_handle)
+    return data
+
+
+def discard_output_file(f_handle):
+    """ Closes and removes the output file. """
+    f_handle.close()
+    tmpmgmt.remove_tmpfile(f_handle.name)
+    return
+
 
 class ProcessResult:
-    """ Result of process execution. """
+    """ Result of process execution. Outputs are kept as raw bytes or mapped
+    files (bytes-like, read-only), use stdout_text and stderr_text where text
+    is needed.
+
+    time is the one compared against time limits, either wall_time or cpu_time
+    as chosen by 'time_limit_policy'. It equals the time limit when exceeded.
+    cpu_time is the user and system time consumed, all in milliseconds.
+
+    memory is the peak memory usage in bytes, which is approximate unless
+    told by the kernel once the process exits (see Process). It equals the
+    memory limit when exceeded.
+
+    stdout_path is the file stdout is read from as it is, if any, which may
+    be handed to other processes instead of the data. """
 
     def __init__(self,
                  time=0,
                  memory=0,
                  return_code=1,
-                 stdout='',
-                 stderr=''):
+                 stdout=b'',
+                 stderr=b'',
+                 cpu_time=0,
+                 wall_time=None,
+                 stdout_path=None):
         self.time = time
         self.memory = memory
         self.return_code = return_code
         self.stdout = stdout
         self.stderr = stderr
+        self.cpu_time = cpu_time
+        self.wall_time = time if wall_time is None else wall_time
+        self.stdout_path = stdout_path
         return
 
+    @property
+    def stdout_text(self):
+        return decode_output(self.stdout)
+
+    @property
+    def stderr_text(self):
+        return decode_output(self.stderr)
+
+    def __getstate__(self):
+        # Mapped outputs could not be pickled, materializing them
+        state = dict(self.__dict__)
+        for key in ['stdout', 'stderr']:
+            if type(state[key]) == mmap.mmap:
+                state[key] = bytes(state[key])
+            continue
+        return state
+
+    def __deepcopy__(self, memo):
+        # Outputs are read-only, therefore shared with the copy
+        ret = ProcessResult()
+        ret.__dict__.update(self.__dict__)
+        return ret
+
     def __repr__(self):
         return repr(table.Table('Process Execution Results', [
             ('Execution Time', self.time),
+            ('CPU Time', self.cpu_time),
+            ('Wall Time', self.wall_time),
             ('Memory Cost', self.memory),
             ('Return Code', self.return_code),
-            ('STDOUT Output', self.stdout),
-            ('STDERR Output', self.stderr),
+            ('STDOUT Output', self.stdout_text),
+            ('STDERR Output', self.stderr_text),
         ]))
     pass
 
@@ -49,102 +163,583 @@ class Process:
     """ One-off process execution, when invoked with the following arguments,
     it returns the execution results in corresponding relevances.
 
-        time_limit: Execution time limit in seconds. If set to zero, this means
-                that there will be no time limit.
+        time_limit: Execution time limit in milliseconds. If set to zero, this
+                means that there will be no time limit. Applies to wall clock
+                or CPU time by 'time_limit_policy', where wall clock time is
+                still limited to 'wall_time_ratio' times of the limit.
         memory_limit: Memory limit of execution in bytes. If set to zero, this
-                means that there will be no memory limit.
+                means that there will be no memory limit. Enforced by a cgroup
+                when 'cgroup_root' is configured, otherwise by sampling the
+                resident set, with RLIMIT_AS capping the address space at
+                'address_space_ratio' times of the limit.
         process_args: Arguments to be passed to process creation.
         stdin: The standard input to be injected to subprocess, default to none.
+                Either str, bytes-like or a list of bytes-like chunks, which
+                are written in order without being joined. May also be a file
+                descriptor or a file object, which the process reads from by
+                itself.
+        stdout: File descriptor the standard output is redirected to. Default
+                to none, where the output is collected into the result.
+        cpu_affinity: Set of CPUs the process is pinned to, default to none.
+        output_limit: Maximum size in bytes of stdout and stderr each, the
+                process is killed upon exceeding. Default to 'max_output'.
+        on_spawn: Function called with the process ID once the process has
+                started, default to none.
+        zygote: Zygote forking the process instead of starting it anew, where
+                process_args are the arguments of the script it runs. Default
+                to none, only used where the watchdog is event-driven.
+        executable: Program run in place of process_args[0], which is still
+                passed on as its name like subprocess.Popen does. For a
+                zygote, the script it runs. Default to none.
+
+    File descriptors given as stdin or stdout are handed over to the process,
+    and closed in the caller once the process has started. File objects are
+    left open for their owner.
 
     The return value should be a dictionary, containing the following elements:
 
-        time: Cost of time of execution in seconds.
-        memory: Cost of memory in bytes.
+        time: Cost of time of execution in milliseconds, as limited.
+        cpu_time: CPU time of execution in milliseconds.
+        wall_time: Wall clock time of execution in milliseconds.
+        memory: Cost of memory in bytes, see below.
         return_code: The return code of the program. 0 if succeeded.
-        stdout: Standard output.
-        stderr: Error output.
+        stdout: Standard output, in bytes (or mapped from a file).
+        stderr: Error output, in bytes (or mapped from a file).
 
-    The process would **NOT** be called interactively. """
+    Memory is the peak resident set, sampled at intervals of up to 10 ms
+    while the process runs, so that the limit is enforced with that delay.
+    Once reaped, rusage tells the exact peak of processes forked from a
+    zygote, and of others exceeding the peak of this process (which they
+    are forked from). Otherwise the samples are reported, which are
+    approximate and may miss growth right before exit. Without event-driven
+    watching, only samples are taken. In a cgroup, it is the cgroup's peak
+    less the page cache charged by the end, approximate as well.
+
+    The process would **NOT** be called interactively by itself, though file
+    descriptors may connect it with other processes. """
 
     def __init__(self,
                  time_limit=0,
                  memory_limit=64*1024*1024*1024,
                  process_args=[],
-                 stdin=''):
+                 stdin='',
+                 cpu_affinity=None,
+                 output_limit=None,
+                 stdout=None,
+                 on_spawn=None,
+                 zygote=None,
+                 executable=None):
         self.time_limit = time_limit
         self.memory_limit = memory_limit
+        self.address_space_limit = 0
+        if memory_limit > 0:
+            self.address_space_limit = int(
+                memory_limit * (config.get_config('address_space_ratio') or 0))
         self.process_args = process_args
-        if type(stdin) == bytes:
-            self.stdin = stdin
-        else:
-            self.stdin = stdin.encode('utf-8')
+        self.cpu_affinity = cpu_affinity
+        if output_limit is None:
+            output_limit = config.get_config('max_output') or 0
+        self.output_limit = output_limit
+        self.cgroup = None
+        self.limit_cpu_time = config.get_config('time_limit_policy') == 'cpu'
+        self.wall_time_limit = time_limit
+        if self.limit_cpu_time:
+            self.wall_time_limit = time_limit * \
+                (config.get_config('wall_time_ratio') or 1)
+        self.stdout = stdout
+        self.on_spawn = on_spawn
+        self.zygote = zygote
+        self.executable = executable
+        self.stdin = stdin
+        if type(stdin) != int and not hasattr(stdin, 'fileno'):
+            if type(stdin) not in {list, tuple}:
+                stdin = [stdin]
+            self.stdin = []
+            for chunk in stdin:
+                if type(chunk) == str:
+                    chunk = chunk.encode('utf-8')
+                self.stdin.append(chunk)
         return
 
     def execute(self):
-        # Starting process
-        proc = subprocess.Popen(self.process_args,
-                                creationflags=platform_subprocess_flags,
-                                stdin=subprocess.PIPE,
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE)
+        if platform_event_watchdog:
+            return self.__execute_event()
+        return self.__execute_polling()
+
+    def __popen(self, stdout_file, stderr_file, **kwargs):
+        """ Starts the process with its redirections, releasing descriptors
+        handed over by the caller. """
+        try:
+            proc = subprocess.Popen(
+                self.process_args,
+                executable=self.executable,
+                stdin=subprocess.PIPE if type(self.stdin) == list
+                else self.stdin,
+                stdout=stdout_file if stdout_file else self.stdout,
+                stderr=stderr_file,
+                **kwargs)
+        finally:
+            if type(self.stdin) == int:
+                os.close(self.stdin)
+            if self.stdout is not None:
+                os.close(self.stdout)
+        if self.on_spawn:
+            self.on_spawn(proc.pid)
+        return proc
+
+    def __spawn_zygote(self, stdout_file, stderr_file):
+        """ Forks the process from the zygote with the limits __prepare_child
+        would have set, releasing descriptors handed over by the caller. """
+        limits = {}
+        if self.cpu_affinity:
+            limits['cpu_affinity'] = list(self.cpu_affinity)
+        if self.cgroup:
+            limits['cgroup_procs'] = self.cgroup.procs_path
+        elif self.address_space_limit > 0:
+            limits['memory_limit'] = self.address_space_limit
+        if self.time_limit > 0:
+            limits['cpu_limit'] = math.ceil(self.time_limit / 1000) + 1
+        if self.output_limit > 0:
+            limits['output_limit'] = self.output_limit
+        stdin_file = None
+        if type(self.stdin) == int:
+            stdin_fd = self.stdin
+        elif type(self.stdin) != list:
+            stdin_fd = os.dup(self.stdin.fileno())  # Left open for the owner
+        else:
+            stdin_fd, stdin_w = os.pipe()
+            stdin_file = open(stdin_w, 'wb', buffering=0)
+        try:
+            proc = self.zygote.spawn(
+                self.process_args,
+                stdin_fd,
+                stdout_file.fileno() if stdout_file else self.stdout,
+                stderr_file.fileno(),
+                limits=limits,
+                stdin_file=stdin_file,
+                script=self.executable)
+        except Exception:
+            if stdin_file:
+                stdin_file.close()
+            raise
+        finally:
+            os.close(stdin_fd)
+            if self.stdout is not None:
+                os.close(self.stdout)
+        if self.on_spawn:
+            self.on_spawn(proc.pid)
+        return proc
+
+    def __prepare_child(self):
+        """ Executed in the child right before exec, the kernel enforces the
+        limits from then on. CPU time is rounded up to whole seconds, the wall
+        clock timer in the parent remains the precise one. """
+        if self.cpu_affinity:
+            os.sched_setaffinity(0, self.cpu_affinity)
+        if self.cgroup:
+            # Memory is limited by the cgroup, charged from exec onwards
+            self.cgroup.attach()
+        elif self.address_space_limit > 0:
+            resource.setrlimit(resource.RLIMIT_AS, (self.address_space_limit,
+                                                    self.address_space_limit))
+        if self.time_limit > 0:
+            cpu_limit = math.ceil(self.time_limit / 1000) + 1
+            resource.setrlimit(resource.RLIMIT_CPU,
+                               (cpu_limit, cpu_limit + 1))
+        if self.output_limit > 0:
+            resource.setrlimit(resource.RLIMIT_FSIZE,
+                               (self.output_limit, self.output_limit))
+        return
+
+    def __execute_event(self):
+        # Starting process, limits are set up prior to exec. Outputs are
+        # written into files directly, where RLIMIT_FSIZE limits their size
+        stdout_file = create_output_file() if self.stdout is None else None
+        stderr_file = create_output_file()
+        # The kernel accounts memory exactly in a cgroup if available, and
+        # the peak is read once the process exits instead of being sampled
+        cgroup_pool = cgroup.get_pool()
+        if cgroup_pool:
+            self.cgroup = cgroup_pool.acquire()
+        sample_memory = True
+        try:
+            if self.cgroup:
+                sample_memory = not self.cgroup.prepare(self.memory_limit)
+            if self.zygote:
+                proc = self.__spawn_zygote(stdout_file, stderr_file)
+            else:
+                proc = self.__popen(stdout_file, stderr_file,
+                                    preexec_fn=self.__prepare_child)
+        except Exception:
+            if self.cgroup:
+                cgroup_pool.release(self.cgroup)
+            for f_handle in [stdout_file, stderr_file]:
+                if f_handle:
+                    discard_output_file(f_handle)
+                continue
+            raise
         # Marking begin timestamp
         time_begin = time.perf_counter_ns()
-        # Setting time limit and memory limit
-        thread_kill = [False, None]
+        if self.wall_time_limit > 0:
+            time_deadline = time_begin + self.wall_time_limit * 1000000
+        else:
+            time_deadline = None
+        # Memory is sampled from the kernel-maintained high-water mark, often
+        # in the beginning and less frequently as the process runs on
         total_memory = 0
 
-        def delimiter(time_begin, time_limit, memory_limit, proc, thread_kill):
-            ps_proc = psutil.Process(proc.pid)
-            total_memory = 0
-            while True:
-                time_cur = time.perf_counter_ns()
-                try:
-                    total_memory = max(total_memory, ps_proc.memory_info().rss)
-                except(psutil.NoSuchProcess):
-                    break
-                # time.sleep(0.015)
-                # This might delay a few seconds...
-                if time_limit > 0 and time_cur - time_begin >= time_limit * 1000000:
-                    thread_kill[1] = 'TLE'
-                    proc.kill()
-                    break
-                if memory_limit > 0 and total_memory >= memory_limit:
-                    thread_kill[1] = 'MLE'
-                    proc.kill()
-                    break
-                # Force termination
-                if thread_kill[0]:
+        def sample():
+            nonlocal total_memory
+            if sample_memory:
+                total_memory = max(total_memory, read_peak_memory(proc.pid))
+                if self.memory_limit > 0 and total_memory >= self.memory_limit:
+                    return 'MLE'
+            if self.limit_cpu_time and self.time_limit > 0 and \
+                    read_cpu_time(proc.pid) >= self.time_limit:
+                return 'TLE'
+            return None
+
+        # Input, termination and limits are all watched by the watchdog. The
+        # zygote reaps its processes, telling through a socket instead
+        pidfd = proc.fileno() if self.zygote else os.pidfd_open(proc.pid)
+        watch = watchdog.get_watchdog().watch(watchdog.Watch(
+            proc,
+            pidfd=pidfd,
+            stdin=self.stdin,
+            deadline=time_deadline,
+            sample=sample if sample_memory or self.limit_cpu_time else None,
+        ))
+        watch.done.wait()
+        limit_exceeded = watch.limit_exceeded
+        # Reaping the process, which had already terminated
+        if self.zygote:
+            _, status, rusage = proc.wait4()
+        else:
+            os.close(pidfd)
+            _, status, rusage = os.wait4(proc.pid, 0)
+        ret_code = os.waitstatus_to_exitcode(status)
+        proc.returncode = ret_code
+        # Samples miss the growth right before exit, which rusage tells once
+        # reaped. Processes started anew report the resident set copied from
+        # this one on fork where larger, bounded by the peak of this one
+        if sample_memory:
+            max_rss = rusage.ru_maxrss * 1024
+            if self.zygote or max_rss > read_peak_memory(os.getpid()):
+                total_memory = max(total_memory, max_rss)
+            if self.memory_limit > 0 and total_memory >= self.memory_limit \
+                    and not limit_exceeded:
+                limit_exceeded = 'MLE'
+        if self.cgroup:
+            if not sample_memory:
+                total_memory = self.cgroup.peak_memory()
+            if self.cgroup.memory_events().get('oom_kill', 0) > 0 and \
+                    not limit_exceeded:
+                limit_exceeded = 'MLE'
+            cgroup_pool.release(self.cgroup)
+        # Retrieving process execution time, both wall clock and CPU
+        time_final = time.perf_counter_ns()
+        wall_time = (time_final - time_begin) // 1000000
+        cpu_time = int((rusage.ru_utime + rusage.ru_stime) * 1000)
+        time_delta = cpu_time if self.limit_cpu_time else wall_time
+        stdout = map_output_file(stdout_file) if stdout_file else b''
+        stderr = map_output_file(stderr_file)
+        # Limits enforced by the kernel
+        if ret_code == -signal.SIGXCPU:
+            limit_exceeded = 'TLE'
+        if self.time_limit > 0 and time_delta >= self.time_limit:
+            limit_exceeded = 'TLE'
+        if ret_code == -signal.SIGXFSZ:
+            limit_exceeded = 'OLE'
+        if ret_code != 0 and self.memory_limit > 0 and not limit_exceeded:
+            for marker in allocation_failure_markers:
+                if stderr.find(marker) >= 0:
+                    limit_exceeded = 'MLE'
                     break
                 continue
-            return total_memory
+        # Executables whose static data exceeds RLIMIT_AS are killed by the
+        # kernel while loading, with SIGSEGV or SIGKILL
+        if ret_code < 0 and self.address_space_limit > 0 and \
+                not self.cgroup and not limit_exceeded and \
+                read_static_memory(self.process_args[0]) >= \
+                self.address_space_limit:
+            limit_exceeded = 'MLE'
+        # Exceptions on runtime...
+        if limit_exceeded == 'TLE':
+            time_delta = self.time_limit
+        if limit_exceeded == 'MLE':
+            total_memory = self.memory_limit
+        final_results = ProcessResult(
+            time=time_delta,
+            memory=total_memory,
+            return_code=ret_code,
+            stdout=stdout,
+            stderr=stderr,
+            cpu_time=cpu_time,
+            wall_time=wall_time,
+        )
+        return final_results
+
+    def __execute_polling(self):
+        # Starting process, outputs are written into files directly
+        stdout_file = create_output_file() if self.stdout is None else None
+        stderr_file = create_output_file()
+        try:
+            proc = self.__popen(stdout_file, stderr_file,
+                                creationflags=platform_subprocess_flags)
+        except Exception:
+            for f_handle in [stdout_file, stderr_file]:
+                if f_handle:
+                    discard_output_file(f_handle)
+                continue
+            raise
+        if self.cpu_affinity:
+            try:
+                psutil.Process(proc.pid).cpu_affinity(list(self.cpu_affinity))
+            except (psutil.Error, AttributeError):
+                pass
+        # Marking begin timestamp
+        time_begin = time.perf_counter_ns()
+        # Setting time limit and memory limit, sampled by the watchdog
+        ps_proc = psutil.Process(proc.pid)
+        total_memory = 0
+        cpu_time = 0
+
+        def sample():
+            nonlocal total_memory, cpu_time
+            total_memory = max(total_memory, ps_proc.memory_info().rss)
+            cpu_times = ps_proc.cpu_times()
+            cpu_time = int((cpu_times.user + cpu_times.system) * 1000)
+            if self.limit_cpu_time and self.time_limit > 0 and \
+                    cpu_time >= self.time_limit:
+                return 'TLE'
+            if self.memory_limit > 0 and total_memory >= self.memory_limit:
+                return 'MLE'
+            if self.output_limit > 0 and max(
+                    os.fstat(f_handle.fileno()).st_size for f_handle in
+                    [stdout_file, stderr_file] if f_handle) >= self.output_limit:
+                return 'OLE'
+            return None
 
-        future = concurrent.futures.ThreadPoolExecutor(max_workers=1).submit(delimiter, time_begin, self.time_limit,
-                                                                             self.memory_limit, proc, thread_kill)
-       # Inputting and waiting for process to terminate
+        time_deadline = None
+        if self.wall_time_limit > 0:
+            time_deadline = time_begin + self.wall_time_limit * 1000000
+        watch = watchdog.get_watchdog().watch(watchdog.Watch(
+            proc, deadline=time_deadline, sample=sample))
+        # Inputting and waiting for process to terminate
         try:
-            stdout, stderr = proc.communicate(input=self.stdin)
+            if proc.stdin:
+                proc.communicate(input=b''.join(self.stdin))
         except Exception:
-            stdout = b''
-            stderr = b''
+            pass
         ret_code = proc.wait()
-        thread_kill[0] = True
-        total_memory = future.result()
-        # Retrieving process execution time
+        watchdog.get_watchdog().unwatch(watch)
+        watch.done.wait()
+        limit_exceeded = watch.limit_exceeded
+        # Retrieving process execution time, CPU time is as last sampled
         time_final = time.perf_counter_ns()
-        time_delta = (time_final - time_begin) // 1000000
+        wall_time = (time_final - time_begin) // 1000000
+        time_delta = cpu_time if self.limit_cpu_time else wall_time
+        if self.time_limit > 0 and time_delta >= self.time_limit:
+            limit_exceeded = 'TLE'
         # Exceptions on runtime...
-        if thread_kill[1] == 'TLE':
+        if limit_exceeded == 'TLE':
             time_delta = self.time_limit
-        if thread_kill[1] == 'MLE':
+        if limit_exceeded == 'MLE':
             total_memory = self.memory_limit
         # Retrieving process results (BINARY!)
+        stdout = map_output_file(stdout_file) if stdout_file else b''
+        stderr = map_output_file(stderr_file)
         # Setting final results
         final_results = ProcessResult(
             time=time_delta,
             memory=total_memory,
             return_code=ret_code,
-            stdout=stdout.decode('utf-8', 'ignore'),
-            stderr=stderr.decode('utf-8', 'ignore'),
+            stdout=stdout,
+            stderr=stderr,
+            cpu_time=cpu_time,
+            wall_time=wall_time,
         )
         return final_results
     pass
+
+
+def tee(source, destinations, retain=None, limit=0, suffix=b''):
+    """ Copies data from the source file descriptor to all destination file
+    descriptors as it arrives, for processes to be connected in a pipeline.
+
+        retain: File object which also receives a copy, default to none.
+        limit: Maximum bytes read, the source is closed beyond that.
+        suffix: Bytes written to destinations after the source's end.
+
+    Destinations are written without blocking, each buffering up to a few
+    chunks before reading stalls. Those that stop reading are dropped. All
+    descriptors are closed on return, which is the count of bytes read. """
+    buffer_limit = 4 * 1024 * 1024
+    buffers = {}
+    for fd in destinations:
+        os.set_blocking(fd, False)
+        buffers[fd] = []
+    poller = select.poll()
+    reading = True
+    total = 0
+    while reading or buffers:
+        # Reading only while every destination keeps up
+        if reading and all(sum(len(view) for view in buffers[fd]) <
+                           buffer_limit for fd in buffers):
+            poller.register(source, select.POLLIN)
+        elif reading:
+            try:
+                poller.unregister(source)
+            except KeyError:
+                pass  # Already stalled
+        for fd in list(buffers):
+            if buffers[fd]:
+                poller.register(fd, select.POLLOUT)
+            elif not reading:
+                # Done writing, signalling end of input
+                del buffers[fd]
+                os.close(fd)
+                try:
+                    poller.unregister(fd)
+                except KeyError:
+                    pass
+            else:
+                try:
+                    poller.unregister(fd)
+                except KeyError:
+                    pass
+            continue
+        if not reading and not buffers:
+            break
+        for fd, _ in poller.poll():
+            if fd == source:
+                data = os.read(source, 65536)
+                total += len(data)
+                if retain:
+                    retain.write(data)
+                if not data or (limit > 0 and total > limit):
+                    reading = False
+                    poller.unregister(source)
+                    os.close(source)
+                    data = data + suffix
+                if data:
+                    for fd_dest in buffers:
+                        buffers[fd_dest].append(memoryview(data))
+                continue
+            if fd not in buffers:
+                continue
+            try:
+                written = os.write(fd, buffers[fd][0])
+                buffers[fd][0] = buffers[fd][0][written:]
+                if len(buffers[fd][0]) <= 0:
+                    buffers[fd].pop(0)
+            except BlockingIOError:
+                pass
+            except OSError:
+                # Destination stopped reading
+                del buffers[fd]
+                os.close(fd)
+                poller.unregister(fd)
+            continue
+        continue
+    if retain:
+        retain.flush()
+    return total
+
+
+def read_static_memory(path):
+    """ Memory an ELF executable maps when loaded in bytes, which is the sum
+    of its loadable segments (including static arrays). Returns 0 if it is
+    not an ELF executable. """
+    try:
+        with open(path, 'rb') as f_handle:
+            header = f_handle.read(64)
+            if header[:4] != b'\x7fELF':
+                return 0
+            is_64 = header[4] == 2
+            order = '<' if header[5] == 1 else '>'
+            if is_64:
+                ph_offset, = struct.unpack_from(order + 'Q', header, 32)
+                ph_size, ph_count = struct.unpack_from(order + 'HH', header, 54)
+            else:
+                ph_offset, = struct.unpack_from(order + 'I', header, 28)
+                ph_size, ph_count = struct.unpack_from(order + 'HH', header, 42)
+            f_handle.seek(ph_offset)
+            table = f_handle.read(ph_size * ph_count)
+        total = 0
+        for i in range(0, ph_count):
+            offset = i * ph_size
+            p_type, = struct.unpack_from(order + 'I', table, offset)
+            if p_type != 1:  # PT_LOAD
+                continue
+            if is_64:
+                p_memsz, = struct.unpack_from(order + 'Q', table, offset + 40)
+            else:
+                p_memsz, = struct.unpack_from(order + 'I', table, offset + 20)
+            total += p_memsz
+            continue
+    except (OSError, struct.error):
+        return 0
+    return total
+
+
+def read_peak_memory(pid):
+    """ Peak resident set size of a running process in bytes, as maintained by
+    the kernel (VmHWM). Returns 0 if the process has already terminated. """
+    try:
+        with open('/proc/%d/status' % pid, 'rb') as f_handle:
+            for line in f_handle:
+                if line.startswith(b'VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def read_cpu_time(pid):
+    """ User and system time of a running process in milliseconds. Returns 0
+    if the process has already terminated. """
+    try:
+        with open('/proc/%d/stat' % pid, 'rb') as f_handle:
+            fields = f_handle.read().rsplit(b')', 1)[1].split()
+    except (OSError, IndexError):
+        return 0
+    ticks = int(fields[11]) + int(fields[12])
+    return ticks * 1000 // os.sysconf('SC_CLK_TCK')
+
+
+def read_waiting_on_pipe(pid):
+    """ Whether a running process waits for input from a pipe, where none of
+    its threads runs and one of them sleeps reading a pipe, as told by the
+    kernel's wait channels. False if it cannot be told. """
+    try:
+        tids = os.listdir('/proc/%d/task' % pid)
+    except OSError:
+        return False
+    reading = False
+    for tid in tids:
+        try:
+            with open('/proc/%d/task/%s/stat' % (pid, tid), 'rb') as f_handle:
+                state = f_handle.read().rsplit(b')', 1)[1].split()[0]
+            with open('/proc/%d/task/%s/wchan' % (pid, tid), 'rb') as f_handle:
+                wchan = f_handle.read().strip()
+        except (OSError, IndexError):
+            return False
+        if state != b'S':
+            return False
+        # Named pipe_wait before Linux 5.6 and anon_pipe_read since 6.15
+        if wchan.endswith(b'pipe_read') or wchan.startswith(b'pipe_wait'):
+            reading = True
+        continue
+    return reading
+
+
+def read_pending_bytes(fd):
+    """ Count of bytes in a pipe yet to be read, 0 if it cannot be told. """
+    if sys.platform.startswith('win'):
+        return 0
+    try:
+        data = fcntl.ioctl(fd, termios.FIONREAD, struct.pack('i', 0))
+    except OSError:
+        return 0
+    return struct.unpack('i', data)[0]
@@ -1,7 +1,11 @@
 import os
+import glob
 import json
 import optparse
+import concurrent.futures
+import multiprocessing
 
+from . import checker
 from . import compiler
 from . import judger
 from . import table
@@ -17,21 +21,49 @@ opts.add_option('-i', '--input',
 opts.add_option('--input-type',
                 dest='input_type', type='string', default='',
                 help='Force type of the standard input (Python/File...)')
+opts.add_option('--generator-cases',
+                dest='generator_cases', type='int', default=1,
+                help='Cases asked of the input generator per run, separated '
+                'by lines of \'---\' in its output')
 opts.add_option('-o', '--output',
                 dest='output', type='string', default='',
                 help='Standard output to be compared')
 opts.add_option('--output-type',
                 dest='output_type', type='string', default='',
                 help='Force type of the standard output (C++/Python/File...)')
+opts.add_option('--interactor',
+                dest='interactor', type='string', default='',
+                help='Interactor of interactive problems, replacing output')
 opts.add_option('-c', '--code',
                 dest='code', type='string', default='',
                 help='File of the user\'s code')
+opts.add_option('--batch',
+                dest='batch', type='string', default='',
+                help='Judge many submissions, given as a glob pattern or '
+                '@manifest listing a file per line, in place of code')
 opts.add_option('--code-type',
                 dest='code_type', type='string', default='',
                 help='Type of the user\'s code (C/C++/Python...)')
+opts.add_option('--checker',
+                dest='checker', type='string', default='tokens',
+                help='Checker of outputs (exact/tokens/float/lines/unordered) '
+                'or source of a testlib checker')
+opts.add_option('--float-eps',
+                dest='float_eps', type='float', default=1e-6,
+                help='Absolute and relative error allowed by the float checker')
 opts.add_option('-x', '--count',
                 dest='count', type='int', default=1,
                 help='Iterations of judging')
+opts.add_option('-J', '--jobs',
+                dest='jobs', type='int', default=1,
+                help='Number of tests judged in parallel, or submissions with '
+                '--batch')
+opts.add_option('-p', '--parallel',
+                dest='parallel', action='store_true', default=False,
+                help='Run standard and user programs concurrently')
+opts.add_option('--pipeline',
+                dest='pipeline', action='store_true', default=False,
+                help='Stream generated input into programs as it is produced')
 opts.add_option('-t', '--time-limit',
                 dest='time_limit', type='int', default=1000,
                 help='Time limit of execution (ms)')
@@ -41,6 +73,11 @@ opts.add_option('-m', '--memory-limit',
 opts.add_option('-s', '--seed',
                 dest='seed', type='int', default=0,
                 help='Force random seed')
+opts.add_option('--export-tests',
+                dest='export_tests', type='string', default='',
+                help='Freeze inputs and standard outputs judged into test data '
+                'in the directory, read back with -i DIR/data.in* -o '
+                'DIR/data.ans*')
 opts.add_option('-j', '--json-output',
                 dest='json_output_file', type='string', default='./results.json',
                 help='Output location of exact results in JSON')
@@ -53,6 +90,207 @@ opts.add_option('-v', '--visualize',
 
 commands, args = opts.parse_args()
 
+# Judger shared with worker processes, which inherit it upon fork
+j_worker = None
+
+
+def init_worker(worker_counter):
+    """ Pins each worker process to CPUs of its own, if there are enough. """
+    with worker_counter.get_lock():
+        worker_id = worker_counter.value
+        worker_counter.value += 1
+    if not hasattr(os, 'sched_getaffinity'):
+        return
+    cpus = sorted(os.sched_getaffinity(0))
+    width = 2 if commands.parallel else 1
+    if len(cpus) < commands.jobs * width:
+        return
+    os.sched_setaffinity(0, cpus[worker_id * width:(worker_id + 1) * width])
+    return
+
+
+def judge_test(run_count):
+    """ Judges one test in a worker process, returning its JudgerResult. """
+    return j_worker.judge(
+        time_limit=commands.time_limit,
+        memory_limit=commands.memory_limit,
+        test_id=run_count)
+
+
+def list_submissions(batch):
+    """ Source files of submissions, either listed in a manifest given as
+    '@path' (one per line, '#' for comments) or matching a glob pattern. """
+    if batch.startswith('@'):
+        with open(batch[1:], 'r', encoding='utf-8') as f_handle:
+            lines = [line.strip() for line in f_handle]
+        return [line for line in lines if line and not line.startswith('#')]
+    return sorted(glob.glob(batch))
+
+
+def export_results(all_results):
+    """ Results of all tests in the structure of JSON output. """
+    json_output = {
+        'pyjudge-version': __version,
+        'compiler-output': {
+            'input': {
+                'return-code': all_results[0].input_compile_result.return_code,
+                'output': all_results[0].input_compile_result.output,
+            },
+            'output': {
+                'return-code': all_results[0].stdout_compile_result.return_code,
+                'output': all_results[0].stdout_compile_result.output,
+            },
+            'user-code': {
+                'return-code': all_results[0].out_compile_result.return_code,
+                'output': all_results[0].out_compile_result.output,
+            },
+        },
+        'judger-output': [],
+    }
+    show_output = commands.json_export_io != ''
+    for result_id in range(0, len(all_results)):
+        results = all_results[result_id]
+        json_output['judger-output'].append({
+            'judge-id': result_id,
+            'hash': results.hash(),
+            'execution-status': {
+                'input': {
+                    'return-code': results.input_execute_result.return_code,
+                    'time': results.input_execute_result.time,
+                    'cpu-time': results.input_execute_result.cpu_time,
+                    'wall-time': results.input_execute_result.wall_time,
+                    'memory': results.input_execute_result.memory,
+                    'stdout': results.input_execute_result.stdout_text if commands.json_export_io else '',
+                    'stderr': results.input_execute_result.stderr_text if commands.json_export_io else '',
+                },
+                'output': {
+                    'return-code': results.stdout_execute_result.return_code,
+                    'time': results.stdout_execute_result.time,
+                    'cpu-time': results.stdout_execute_result.cpu_time,
+                    'wall-time': results.stdout_execute_result.wall_time,
+                    'memory': results.stdout_execute_result.memory,
+                    'stdout': results.stdout_execute_result.stdout_text if commands.json_export_io else '',
+                    'stderr': results.stdout_execute_result.stderr_text if commands.json_export_io else '',
+                },
+                'user-code': {
+                    'return-code': results.out_execute_result.return_code,
+                    'time': results.out_execute_result.time,
+                    'cpu-time': results.out_execute_result.cpu_time,
+                    'wall-time': results.out_execute_result.wall_time,
+                    'memory': results.out_execute_result.memory,
+                    'stdout': results.out_execute_result.stdout_text if commands.json_export_io else '',
+                    'stderr': results.out_execute_result.stderr_text if commands.json_export_io else '',
+                },
+            },
+            'judge-result': results.judge_result,
+            'judge-result-str': judger.status_codes[results.judge_result],
+            'judge-message': results.judge_message,
+            'display-output': commands.json_export_io != '',
+        })
+    return json_output
+
+
+def write_json(json_output):
+    json_stringify = json.dumps(
+        json_output,
+        indent=4,
+        sort_keys=True)
+    try:
+        if not commands.json_output_file:
+            raise
+        json_handle = open(commands.json_output_file, 'w', encoding='utf-8')
+        json_handle.write(json_stringify)
+        json_handle.flush()
+        json_handle.close()
+    except:
+        print('!!! Unable to write to JSON file.')
+    else:
+        print('... Succeeded.')
+    return
+
+
+def export_test_data(all_results):
+    if not commands.export_tests or commands.interactor:
+        return
+    print('--> Exporting tests to %s...' % commands.export_tests)
+    try:
+        count = judger.export_tests(all_results, commands.export_tests)
+    except OSError:
+        print('!!! Unable to export tests.')
+    else:
+        print('... Exported %d tests.' % count)
+    return
+
+
+def judge_batch(comp_input, comp_output, comp_checker):
+    """ Judges all submissions of --batch, sharing input and standard output
+    of every test. Returns the exit code. """
+    try:
+        submissions = list_submissions(commands.batch)
+    except OSError:
+        submissions = []
+    if not submissions:
+        print('pyjudge: fatal error: no submissions found')
+        print('judge process terminated')
+        return 1
+    comp_codes = [compiler.AdaptiveCompiler(
+        path, source_type=commands.code_type or None) for path in submissions]
+    j_batch = judger.BatchJudger(
+        input_handle=comp_input,
+        out_handles=comp_codes,
+        stdout_handle=comp_output,
+        seed=commands.seed,
+        checker=comp_checker,
+        jobs=commands.jobs)
+    print('... Compilation complete.')
+
+    # Judging results, a list of results per submission
+    all_results = [[] for path in submissions]
+    for run_count in range(0, commands.count):
+        print('--> Running judge on test #%d:' % (run_count + 1,))
+        results = j_batch.judge(
+            time_limit=commands.time_limit,
+            memory_limit=commands.memory_limit,
+            test_id=run_count)
+        for path, result, submission_results in \
+                zip(submissions, results, all_results):
+            submission_results.append(result)
+            print('... %s: %s' % (path, judger.status_codes[result.judge_result]))
+            continue
+        continue
+
+    # Close compilers at termination
+    j_batch.close()
+    for comp in [comp_input, comp_output] + comp_codes:
+        if not comp.closed():
+            comp.close()
+        continue
+    comp_checker.close()
+
+    # Print final results
+    print('--> All tests done.')
+    tab_inp = []
+    for path, submission_results in zip(submissions, all_results):
+        accepted = sum(1 for res in submission_results
+                       if res.judge_result == 'AC')
+        tab_inp.append((path, '%d / %d accepted' % (
+            accepted, len(submission_results))))
+        continue
+    tab = table.Table(title='Aggregative results', data=tab_inp)
+    print(tab)
+
+    # Inputs and standard outputs are the same for all submissions
+    export_test_data(all_results[0])
+    print('--> Writing results statistics to JSON...')
+    write_json({
+        'pyjudge-version': __version,
+        'submissions': [dict(export_results(submission_results), code=path)
+                        for path, submission_results in
+                        zip(submissions, all_results)],
+    })
+    return 0
+
+
 # Main function
 
 
@@ -77,9 +315,11 @@ def main():
     try:
         if not commands.input:
             raise Exception()
-        if not commands.output:
+        if not commands.output and not commands.interactor:
             raise Exception()
-        if not commands.code:
+        if not commands.code and not commands.batch:
+            raise Exception()
+        if commands.batch and commands.interactor:
             raise Exception()
     except:
         print('pyjudge: fatal error: arguments insufficient')
@@ -92,16 +332,30 @@ def main():
     comp_input = compiler.AdaptiveCompiler(
         commands.input,
         source_type=commands.input_type or None)
+    if commands.generator_cases > 1 and comp_input.runs_program:
+        comp_input = compiler.MultiCaseCompiler(
+            comp_input, commands.generator_cases)
     # comp_input.compile()
     # print('... Compilation complete.')
 
     # print('--> Compiling standard output...')
     comp_output = compiler.AdaptiveCompiler(
-        commands.output,
+        commands.interactor or commands.output,
         source_type=commands.output_type or None)
     # comp_output.compile()
     # print('... Compilation complete.')
 
+    try:
+        comp_checker = checker.create_checker(
+            commands.checker, float_eps=commands.float_eps)
+    except ValueError as err:
+        print('pyjudge: fatal error: %s' % err.args[0])
+        print('judge process terminated')
+        return 1
+
+    if commands.batch:
+        return judge_batch(comp_input, comp_output, comp_checker)
+
     # print('--> Compiling user code...')
     comp_code = compiler.AdaptiveCompiler(
         commands.code,
@@ -110,24 +364,53 @@ def main():
     # print('... Compilation complete.')
 
     # Compile files with judger
-    j_worker = judger.DataComparisonJudger(
-        input_handle=comp_input,
-        out_handle=comp_code,
-        stdout_handle=comp_output,
-        seed=commands.seed)
+    global j_worker
+    if commands.interactor:
+        j_worker = judger.InteractiveJudger(
+            interactor_handle=comp_output,
+            out_handle=comp_code,
+            input_handle=comp_input,
+            seed=commands.seed)
+    else:
+        j_worker = judger.DataComparisonJudger(
+            input_handle=comp_input,
+            out_handle=comp_code,
+            stdout_handle=comp_output,
+            seed=commands.seed,
+            parallel=commands.parallel,
+            pipeline=commands.pipeline,
+            retain_input=commands.json_export_io or bool(commands.export_tests),
+            checker=comp_checker)
     print('... Compilation complete.')
 
     # Judging results
     all_results = []
-    for run_count in range(0, commands.count):
-        print('--> Running judge on test #%d:' % (run_count + 1,))
-        results = j_worker.judge(
-            time_limit=commands.time_limit,
-            memory_limit=commands.memory_limit)
-        all_results.append(results)
-        print('... Judge complete. Results:')
-        print(results)
-        continue
+    if commands.jobs > 1 and commands.count > 1 and \
+            'fork' in multiprocessing.get_all_start_methods():
+        # Workers are forked after compilation, sharing the compiled handles
+        print('--> Running judge on %d tests with %d jobs:' %
+              (commands.count, commands.jobs))
+        mp_context = multiprocessing.get_context('fork')
+        pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=commands.jobs,
+            mp_context=mp_context,
+            initializer=init_worker,
+            initargs=(mp_context.Value('i', 0),))
+        results_iter = pool.map(judge_test, range(0, commands.count))
+        for run_count, results in enumerate(results_iter):
+            all_results.append(results)
+            print('... Judge complete on test #%d. Results:' % (run_count + 1,))
+            print(results)
+            continue
+        pool.shutdown()
+    else:
+        for run_count in range(0, commands.count):
+            print('--> Running judge on test #%d:' % (run_count + 1,))
+            results = judge_test(run_count)
+            all_results.append(results)
+            print('... Judge complete. Results:')
+            print(results)
+            continue
 
     # Close compilers at termination
     if not comp_input.closed():
@@ -136,6 +419,7 @@ def main():
         comp_output.close()
     if not comp_code.closed():
         comp_code.close()
+    comp_checker.close()
 
     # Print final results
     print('--> All tests done.')
@@ -146,71 +430,7 @@ def main():
     tab = table.Table(title='Aggregative results', data=tab_inp)
     print(tab)
 
+    export_test_data(all_results)
     print('--> Writing results statistics to JSON...')
-    json_output = {
-        'pyjudge-version': __version,
-        'compiler-output': {
-            'input': {
-                'return-code': all_results[0].input_compile_result.return_code,
-                'output': all_results[0].input_compile_result.output,
-            },
-            'output': {
-                'return-code': all_results[0].stdout_compile_result.return_code,
-                'output': all_results[0].stdout_compile_result.output,
-            },
-            'user-code': {
-                'return-code': all_results[0].out_compile_result.return_code,
-                'output': all_results[0].out_compile_result.output,
-            },
-        },
-        'judger-output': [],
-    }
-    show_output = commands.json_export_io != ''
-    for result_id in range(0, len(all_results)):
-        results = all_results[result_id]
-        json_output['judger-output'].append({
-            'judge-id': result_id,
-            'hash': results.hash(),
-            'execution-status': {
-                'input': {
-                    'return-code': results.input_execute_result.return_code,
-                    'time': results.input_execute_result.time,
-                    'memory': results.input_execute_result.memory,
-                    'stdout': results.input_execute_result.stdout if commands.json_export_io else '',
-                    'stderr': results.input_execute_result.stderr if commands.json_export_io else '',
-                },
-                'output': {
-                    'return-code': results.stdout_execute_result.return_code,
-                    'time': results.stdout_execute_result.time,
-                    'memory': results.stdout_execute_result.memory,
-                    'stdout': results.stdout_execute_result.stdout if commands.json_export_io else '',
-                    'stderr': results.stdout_execute_result.stderr if commands.json_export_io else '',
-                },
-                'user-code': {
-                    'return-code': results.out_execute_result.return_code,
-                    'time': results.out_execute_result.time,
-                    'memory': results.out_execute_result.memory,
-                    'stdout': results.out_execute_result.stdout if commands.json_export_io else '',
-                    'stderr': results.out_execute_result.stderr if commands.json_export_io else '',
-                },
-            },
-            'judge-result': results.judge_result,
-            'judge-result-str': judger.status_codes[results.judge_result],
-            'display-output': commands.json_export_io != '',
-        })
-    json_stringify = json.dumps(
-        json_output,
-        indent=4,
-        sort_keys=True)
-    try:
-        if not commands.json_output_file:
-            raise
-        json_handle = open(commands.json_output_file, 'w', encoding='utf-8')
-        json_handle.write(json_stringify)
-        json_handle.flush()
-        json_handle.close()
-    except:
-        print('!!! Unable to write to JSON file.')
-    else:
-        print('... Succeeded.')
+    write_json(export_results(all_results))
     return 0
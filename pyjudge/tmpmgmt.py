@@ -9,7 +9,7 @@ __tmp_files = set()
 def create_tmpfile():
     tmp_dir = config.get_config('tmp_dir')
     if not os.path.exists(tmp_dir):
-        os.makedirs(tmp_dir)
+        os.makedirs(tmp_dir, exist_ok=True)  # Compilers may run at once
     while True:
         uid = str(uuid.uuid4())
         pth = os.path.join(tmp_dir, uid)
@@ -4,23 +4,29 @@ import mako.template
 
 from . import vis_html_data
 
-html_template_data_main = r"""
+html_template_data_body = r"""
 <body class="hold-transition skin-blue sidebar-mini">
-<div id="container-mainframe" class="animated">
+"""
+
+html_template_data_main = r"""
+<div id="${prefix}container-mainframe" class="animated">
     <section class="content-header">
         <h1>pyJudge Aggregative Results<small>${json_data['pyjudge-version']}</small></h1>
+        % if json_data.get('code'):
+        <h4>${json_data['code']}</h4>
+        % endif
         <ol class="breadcrumb"><li class="active">Results</li></ol>
     </section>
     <section class="content"><div class="row"><div class="col-md-12">
         <div class="nav-tabs-custom">
             <ul class="nav nav-tabs">
-                <li class="active"><a href="#compiler" data-toggle="tab">Compiler</a></li>
+                <li class="active"><a href="#${prefix}compiler" data-toggle="tab">Compiler</a></li>
                 % for test in json_data['judger-output']:
-                <li><a href="#test-${test['judge-id']}" data-toggle="tab">Test #${test['judge-id'] + 1}</a></li>
+                <li><a href="#${prefix}test-${test['judge-id']}" data-toggle="tab">Test #${test['judge-id'] + 1}</a></li>
                 % endfor
             </ul>
             <div class="tab-content">
-                <div class="active tab-pane" id="compiler">
+                <div class="active tab-pane" id="${prefix}compiler">
                     <div class="form-horizontal"><div class="form-group">
                         <label class="col-sm-2 control-label">Input / Compiler Return Code</label>
                         <div class="col-sm-10"><input class="form-control" value="${json_data['compiler-output']['input']['return-code']}"></div>
@@ -59,7 +65,7 @@ html_template_data_main = r"""
                     % endfor
                 </div>
                 % for test in json_data['judger-output']:
-                <div class="tab-pane" id="test-${test['judge-id']}">
+                <div class="tab-pane" id="${prefix}test-${test['judge-id']}">
                     <div class="form-horizontal"><div class="form-group">
                         <label class="col-sm-2 control-label">Status</label>
                         <div class="col-sm-10"><input class="form-control" value="${test['judge-result-str']}"></div>
@@ -133,14 +139,21 @@ test['execution-status']['output']['stdout'] = '\n'.join(n_sout)
 """
 
 def create(json_data):
-    """ Create visualized HTML with JSON input in dict(). """
+    """ Create visualized HTML with JSON input in dict(). Results of batch
+    judging are shown one submission after another. """
     data = html_template_data_main
     if type(data) == bytes:
         data = data.decode('utf-8', 'ignore')
-    data = mako.template.Template(
+    template = mako.template.Template(
         text = data,
-        input_encoding = 'utf-8').render(
-            json_data = json_data
+        input_encoding = 'utf-8')
+    submissions = json_data.get('submissions', [json_data])
+    data = html_template_data_body
+    for i in range(0, len(submissions)):
+        data += template.render(
+            json_data = submissions[i],
+            prefix = 'submission-%d-' % i if len(submissions) > 1 else ''
         )
+        continue
     data = vis_html_data.html_template_data_begin + data + vis_html_data.html_template_data_end
     return data
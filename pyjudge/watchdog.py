@@ -0,0 +1,228 @@
+import heapq
+import itertools
+import os
+import selectors
+import threading
+import time
+
+# Watchdog of the current process, see get_watchdog()
+__watchdog = None
+__watchdog_lock = threading.Lock()
+
+
+class Watch:
+    """ Process watched by the watchdog. Receives following arguments:
+
+        proc : The subprocess.Popen of the process.
+        pidfd : Descriptor readable once the process terminates, default to
+                none where the owner tells the end with Watchdog.unwatch().
+        stdin : Chunks of bytes-like data written to proc.stdin, which is
+                closed afterwards. Default to none, where proc.stdin is left
+                to the owner.
+        deadline : perf_counter_ns() at which the process is killed as 'TLE',
+                default to none.
+        sample : Function called from time to time, often in the beginning and
+                less frequently later on. Returns the name of a limit for the
+                process to be killed, or none. Default to none.
+
+    limit_exceeded tells the limit the process was killed upon, and done is
+    set once the process terminates (when watched through a pidfd). """
+
+    def __init__(self, proc, pidfd=None, stdin=None, deadline=None,
+                 sample=None):
+        self.proc = proc
+        self.pidfd = pidfd
+        self.feeds_stdin = stdin is not None and proc.stdin is not None
+        self.stdin_views = []
+        if self.feeds_stdin:
+            self.stdin_views = [memoryview(chunk) for chunk in stdin
+                                if len(chunk) > 0]
+        self.deadline = deadline
+        self.sample = sample
+        self.sample_interval = 500000
+        self.next_sample = None
+        self.limit_exceeded = None
+        self.done = threading.Event()
+        self.timer = None
+        return
+
+    def next_wake(self):
+        wake = [self.deadline, self.next_sample if self.sample else None]
+        wake = [t for t in wake if t is not None]
+        return min(wake) if wake else None
+
+    def kill(self, limit):
+        if not self.limit_exceeded:
+            self.limit_exceeded = limit
+        self.deadline = None
+        self.sample = None
+        try:
+            self.proc.kill()
+        except OSError:
+            pass
+        return
+    pass
+
+
+class Watchdog:
+    """ Watches any number of processes from a single thread, multiplexing
+    termination (pidfds), standard input and a heap of timers for deadlines
+    and samples over one selector (epoll on Linux). """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.__selector = selectors.DefaultSelector()
+        self.__wakeup_r, self.__wakeup_w = os.pipe()
+        os.set_blocking(self.__wakeup_r, False)
+        os.set_blocking(self.__wakeup_w, False)
+        self.__selector.register(self.__wakeup_r, selectors.EVENT_READ)
+        self.__lock = threading.Lock()
+        self.__requests = []
+        self.__timers = []
+        self.__sequence = itertools.count()
+        self.__thread = threading.Thread(target=self.__run, daemon=True,
+                                         name='pyjudge-watchdog')
+        self.__thread.start()
+        return
+
+    def watch(self, watch):
+        """ watch(watch) -- Start watching, returns the Watch. """
+        self.__request(('watch', watch))
+        return watch
+
+    def unwatch(self, watch):
+        """ unwatch(watch) -- Stop watching a process without a pidfd, once
+        the owner has reaped it. """
+        self.__request(('unwatch', watch))
+        return
+
+    def __request(self, request):
+        with self.__lock:
+            self.__requests.append(request)
+        try:
+            os.write(self.__wakeup_w, b'\0')
+        except BlockingIOError:
+            pass  # Already woken up
+        return
+
+    def __run(self):
+        while True:
+            timeout = None
+            if self.__timers:
+                timeout = max(self.__timers[0][0] - time.perf_counter_ns(), 0)
+                timeout /= 1e9
+            for key, _ in self.__selector.select(timeout):
+                if key.fileobj == self.__wakeup_r:
+                    self.__handle_requests()
+                elif key.fileobj == key.data.pidfd:
+                    self.__finish(key.data)
+                else:
+                    self.__write_stdin(key.data)
+                continue
+            self.__handle_timers()
+            continue
+        return
+
+    def __handle_requests(self):
+        try:
+            while os.read(self.__wakeup_r, 4096):
+                continue
+        except BlockingIOError:
+            pass
+        with self.__lock:
+            requests, self.__requests = self.__requests, []
+        for action, watch in requests:
+            if action == 'watch':
+                if watch.pidfd is not None:
+                    self.__selector.register(
+                        watch.pidfd, selectors.EVENT_READ, watch)
+                if watch.stdin_views:
+                    os.set_blocking(watch.proc.stdin.fileno(), False)
+                    self.__selector.register(
+                        watch.proc.stdin, selectors.EVENT_WRITE, watch)
+                elif watch.feeds_stdin:
+                    watch.proc.stdin.close()
+                if watch.sample:
+                    watch.next_sample = time.perf_counter_ns()
+                self.__schedule(watch)
+            else:
+                self.__finish(watch)
+            continue
+        return
+
+    def __schedule(self, watch):
+        wake = watch.next_wake()
+        if wake is None:
+            watch.timer = None
+            return
+        watch.timer = next(self.__sequence)
+        heapq.heappush(self.__timers, (wake, watch.timer, watch))
+        return
+
+    def __handle_timers(self):
+        time_cur = time.perf_counter_ns()
+        while self.__timers and self.__timers[0][0] <= time_cur:
+            _, timer, watch = heapq.heappop(self.__timers)
+            if timer != watch.timer or watch.done.is_set():
+                continue  # Superseded
+            if watch.deadline is not None and time_cur >= watch.deadline:
+                watch.kill('TLE')
+            if watch.sample and time_cur >= watch.next_sample:
+                try:
+                    limit = watch.sample()
+                except Exception:
+                    limit = None
+                    watch.sample = None
+                if limit:
+                    watch.kill(limit)
+                elif watch.sample:
+                    watch.next_sample = time_cur + watch.sample_interval
+                    watch.sample_interval = min(
+                        watch.sample_interval * 2, 10000000)
+            self.__schedule(watch)
+            continue
+        return
+
+    def __write_stdin(self, watch):
+        if watch.done.is_set():
+            return
+        stdin = watch.proc.stdin
+        try:
+            written = os.write(stdin.fileno(), watch.stdin_views[0][:65536])
+            watch.stdin_views[0] = watch.stdin_views[0][written:]
+            if len(watch.stdin_views[0]) <= 0:
+                watch.stdin_views.pop(0)
+        except BlockingIOError:
+            return
+        except (BrokenPipeError, ValueError):
+            watch.stdin_views = []
+        if not watch.stdin_views:
+            self.__selector.unregister(stdin)
+            stdin.close()
+        return
+
+    def __finish(self, watch):
+        if watch.done.is_set():
+            return
+        if watch.pidfd is not None:
+            self.__selector.unregister(watch.pidfd)
+        if watch.feeds_stdin:
+            try:
+                self.__selector.unregister(watch.proc.stdin)
+            except (KeyError, ValueError):
+                pass  # Written completely
+            watch.proc.stdin.close()
+        watch.timer = None
+        watch.done.set()
+        return
+    pass
+
+
+def get_watchdog():
+    """ The watchdog of the current process, started upon first use. Forked
+    processes start watchdogs of their own, as threads are not forked. """
+    global __watchdog
+    with __watchdog_lock:
+        if __watchdog is None or __watchdog.pid != os.getpid():
+            __watchdog = Watchdog()
+        return __watchdog
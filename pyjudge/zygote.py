@@ -0,0 +1,193 @@
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+
+# Zygotes of the current process by interpreter, see get_zygote()
+__zygotes = {}
+__zygotes_lock = threading.Lock()
+
+# Descriptor passing over SEQPACKET sockets, as the zygote server relies on
+platform_zygote = sys.platform.startswith('linux') and \
+    hasattr(socket, 'send_fds') and hasattr(os, 'pidfd_open')
+
+
+class ZygoteRusage:
+    """ Resource usage of a process run through a zygote, as far as the zygote
+    reported it. """
+
+    def __init__(self, ru_utime=0.0, ru_stime=0.0, ru_maxrss=0):
+        self.ru_utime = ru_utime
+        self.ru_stime = ru_stime
+        self.ru_maxrss = ru_maxrss
+        return
+    pass
+
+
+class ZygoteChild:
+    """ Process forked by a zygote, standing in for subprocess.Popen where the
+    watchdog and Process are concerned. It is not a child of this process and
+    cannot be waited on directly, fileno() becomes readable instead once the
+    zygote has reaped it, and wait4() then tells its exit status. """
+
+    def __init__(self, pid, reply, stdin=None):
+        self.pid = pid
+        self.stdin = stdin
+        self.returncode = None
+        self.__reply = reply
+        # Signals go through a pidfd, immune to reuse of the process ID
+        try:
+            self.__pidfd = os.pidfd_open(pid)
+        except OSError:
+            self.__pidfd = None
+        return
+
+    def fileno(self):
+        return self.__reply.fileno()
+
+    def start(self):
+        """ start() -- Let the process run, which waits for this once forked
+        so that it could be watched from the very beginning. """
+        try:
+            self.__reply.sendall(b'\0')
+        except OSError:
+            pass  # Terminated while setting up
+        return
+
+    def kill(self):
+        if self.__pidfd is None:
+            return
+        signal.pidfd_send_signal(self.__pidfd, signal.SIGKILL)
+        return
+
+    def wait4(self):
+        """ wait4() -- Wait for the zygote to reap the process, returns the
+        process ID, wait status and resource usage as os.wait4() does. A
+        zygote gone in the meantime is reported as if the process was
+        killed. """
+        try:
+            message = self.__reply.recv(256)
+        except OSError:
+            message = b''
+        self.__reply.close()
+        if self.__pidfd is not None:
+            os.close(self.__pidfd)
+            self.__pidfd = None
+        try:
+            status, utime, stime, maxrss = message.split()
+            status = int(status)
+            rusage = ZygoteRusage(float(utime), float(stime), int(maxrss))
+        except ValueError:
+            status = signal.SIGKILL
+            rusage = ZygoteRusage()
+        self.returncode = os.waitstatus_to_exitcode(status)
+        return self.pid, status, rusage
+    pass
+
+
+class Zygote:
+    """ Python interpreter forking a process for every script run through
+    it, sparing the startup of the interpreter and the import of commonly
+    used modules on each execution. Receives following arguments:
+
+        interpreter_args : Arguments invoking the interpreter, without the
+                script, e.g. ['python3'].
+        preload : Modules imported by the zygote ahead of time, default to
+                none.
+
+    Forked processes start from the same hash seed, other than that they
+    behave as freshly started interpreters. """
+
+    def __init__(self, interpreter_args, preload=None):
+        self.interpreter_args = list(interpreter_args)
+        self.pid = os.getpid()
+        self.__lock = threading.Lock()
+        server_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                   'zygote_server.py')
+        self.__control, server_control = socket.socketpair(
+            socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        try:
+            self.__proc = subprocess.Popen(
+                self.interpreter_args + [server_path,
+                                         str(server_control.fileno())] +
+                list(preload or []),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                pass_fds=[server_control.fileno()])
+        except Exception:
+            self.__control.close()
+            raise
+        finally:
+            server_control.close()
+        return
+
+    def alive(self):
+        return self.__proc.poll() is None
+
+    def spawn(self, args, stdin, stdout, stderr, limits=None, stdin_file=None,
+              script=None):
+        """ spawn(args, stdin, stdout, stderr, limits, stdin_file, script) --
+        Fork a process running the script with sys.argv set to args, where
+        script defaults to args[0]. sys.path[0] follows args[0] either way.
+        Standard streams are given as descriptors, which are not closed.
+        stdin_file becomes the stdin of the returned ZygoteChild, the writing
+        end of a pipe if any. limits may contain following keys:
+
+            cgroup_procs : cgroup.procs of the cgroup to join.
+            cpu_affinity : CPUs to run on.
+            memory_limit, cpu_limit, output_limit : RLIMIT_AS, RLIMIT_CPU
+                    and RLIMIT_FSIZE, in bytes or seconds.
+            cwd : Working directory, default to the current one.
+
+        The process is started right away. Raises OSError if the zygote is
+        not responding. """
+        request = dict(limits or {})
+        request['args'] = list(args)
+        if script:
+            request['script'] = script
+        request.setdefault('cwd', os.getcwd())
+        reply, server_reply = socket.socketpair(
+            socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        try:
+            with self.__lock:
+                socket.send_fds(self.__control,
+                                [json.dumps(request).encode('utf-8')],
+                                [stdin, stdout, stderr, server_reply.fileno()])
+            message = reply.recv(64)
+            if not message:
+                raise OSError('Zygote terminated unexpectedly')
+            child = ZygoteChild(int(message), reply, stdin=stdin_file)
+        except Exception:
+            reply.close()
+            raise
+        finally:
+            server_reply.close()
+        child.start()
+        return child
+
+    def close(self):
+        """ close() -- Stop the zygote, processes running remain. """
+        self.__control.close()
+        try:
+            self.__proc.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            self.__proc.kill()
+            self.__proc.wait()
+        return
+    pass
+
+
+def get_zygote(interpreter_args, preload=None):
+    """ The zygote of the current process for the interpreter, started upon
+    first use and restarted if it has terminated. """
+    key = tuple(interpreter_args)
+    with __zygotes_lock:
+        zygote = __zygotes.get(key)
+        if zygote is None or zygote.pid != os.getpid() or not zygote.alive():
+            zygote = Zygote(interpreter_args, preload=preload)
+            __zygotes[key] = zygote
+        return zygote
@@ -0,0 +1,176 @@
+""" Python zygote, forking a process for each submission run through it.
+
+Started by pyjudge.zygote as 'python zygote_server.py <socket fd> [modules]',
+where the modules are imported ahead of time and thereby shared by all
+forked processes. Only the standard library is used, as it runs under the
+interpreter configured for submissions.
+
+Requests arrive on a SOCK_SEQPACKET socket as JSON, carrying descriptors of
+stdin, stdout, stderr and a socket to reply on. The reply socket receives
+the process ID once forked, then the exit status, CPU times and peak resident
+set once reaped.
+The forked process waits for a byte on the reply socket before running, so
+that the client could watch it in time. """
+
+import io
+import json
+import os
+import pkgutil
+import resource
+import runpy
+import signal
+import socket
+import sys
+import traceback
+import types
+
+# Reply sockets of running processes, by process ID
+replies = {}
+
+
+def reap(*args):
+    while True:
+        try:
+            pid, status, rusage = os.wait4(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+        reply = replies.pop(pid, None)
+        if reply is None:
+            continue
+        try:
+            reply.sendall(b'%d %.6f %.6f %d\n' % (
+                status, rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss))
+        except OSError:
+            pass
+        reply.close()
+        continue
+    return
+
+
+def run_script(path, script=None):
+    """ Runs the script at path as __main__, from the bytecode in script
+    if given. """
+    if not script:
+        runpy.run_path(path, run_name='__main__')
+        return
+    with open(script, 'rb') as f_handle:
+        code = pkgutil.read_code(f_handle)
+    main = types.ModuleType('__main__')
+    main.__file__ = path
+    main.__builtins__ = __builtins__
+    sys.modules['__main__'] = main
+    exec(code, main.__dict__)
+    return
+
+
+def run_child(request, fds, control):
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGCHLD})
+    control.close()
+    for reply in replies.values():
+        reply.close()
+    reply = socket.socket(fileno=fds[3])
+    for i in range(0, 3):
+        os.dup2(fds[i], i)
+        os.close(fds[i])
+        continue
+    # Limits as applied to processes started otherwise
+    if request.get('cgroup_procs'):
+        with open(request['cgroup_procs'], 'w') as f_handle:
+            f_handle.write('0')
+    if request.get('cpu_affinity'):
+        os.sched_setaffinity(0, request['cpu_affinity'])
+    for name, limit in [('RLIMIT_AS', request.get('memory_limit')),
+                        ('RLIMIT_CPU', request.get('cpu_limit')),
+                        ('RLIMIT_FSIZE', request.get('output_limit'))]:
+        if limit:
+            hard = limit + 1 if name == 'RLIMIT_CPU' else limit
+            resource.setrlimit(getattr(resource, name), (limit, hard))
+        continue
+    os.chdir(request['cwd'])
+    # Fresh standard streams and states, as a new interpreter would have
+    sys.stdin = io.TextIOWrapper(io.open(0, 'rb', closefd=False))
+    sys.stdout = io.TextIOWrapper(io.open(1, 'wb', closefd=False))
+    sys.stderr = io.TextIOWrapper(io.open(2, 'wb', closefd=False),
+                                  errors='backslashreplace',
+                                  line_buffering=True)
+    sys.__stdin__, sys.__stdout__, sys.__stderr__ = \
+        sys.stdin, sys.stdout, sys.stderr
+    if 'random' in sys.modules:
+        sys.modules['random'].seed()
+    sys.argv = list(request['args'])
+    sys.path[0] = os.path.dirname(os.path.abspath(sys.argv[0]))
+    # Running once the client is ready
+    reply.recv(1)
+    reply.close()
+    code = 0
+    try:
+        run_script(sys.argv[0], request.get('script'))
+    except SystemExit as err:
+        if err.code is None:
+            code = 0
+        elif isinstance(err.code, int):
+            code = err.code
+        else:
+            print(err.code, file=sys.stderr)
+            code = 1
+    except BaseException as err:
+        # Frames of the zygote and runpy are left out of the traceback
+        tb = err.__traceback__
+        while tb and (tb.tb_frame.f_globals is globals() or
+                      tb.tb_frame.f_globals.get('__name__') == 'runpy'):
+            tb = tb.tb_next
+        traceback.print_exception(type(err), err, tb)
+        code = 1
+    try:
+        sys.stdout.flush()
+    except Exception:
+        code = 120
+    try:
+        sys.stderr.flush()
+    except Exception:
+        pass
+    os._exit(code & 0xff)
+    return
+
+
+def main():
+    control = socket.socket(fileno=int(sys.argv[1]))
+    for name in sys.argv[2:]:
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+        continue
+    signal.signal(signal.SIGCHLD, reap)
+    while True:
+        try:
+            message, fds, _, _ = socket.recv_fds(control, 65536, 4)
+        except OSError:
+            break
+        if not message:
+            break  # Client has gone
+        # Reaping is held off until the process is registered
+        signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGCHLD})
+        try:
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    run_child(json.loads(message), fds, control)
+                finally:
+                    os._exit(1)
+            for fd in fds[:3]:
+                os.close(fd)
+            reply = socket.socket(fileno=fds[3])
+            replies[pid] = reply
+            reply.sendall(b'%d\n' % pid)
+        finally:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGCHLD})
+        continue
+    return
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+#include <cstring>
+#include <iostream>
+using namespace std;
+char buf[1024 * 1024 * 1024];
+int a, b;
+int main() {
+	memset(buf, 1, sizeof(buf));
+	cin >> a >> b;
+	cout << a + b + buf[a % 1024] - 1 << endl;
+	return 0;
+}
@@ -0,0 +1,58 @@
+import os
+import sys
+
+import pytest
+
+from pyjudge import cgroup
+from pyjudge import config
+from pyjudge import process
+
+
+@pytest.fixture
+def cgroup_root():
+    # A cgroup v2 root delegated to this user, e.g. by systemd-run --user
+    # --scope -p Delegate=yes, moved out of by the test runner itself
+    root = os.environ.get('PYJUDGE_CGROUP_ROOT')
+    if not root or not process.platform_event_watchdog:
+        pytest.skip('requires a delegated cgroup v2 root in '
+                    'PYJUDGE_CGROUP_ROOT')
+    config.set_config('cgroup_root', root)
+    if not cgroup.available():
+        config.set_config('cgroup_root', None)
+        pytest.skip('memory controller not available under %s' % root)
+    yield root
+    cgroup.get_pool().close()
+    config.set_config('cgroup_root', None)
+    return
+
+
+def run_python(code, memory_limit):
+    return process.Process(time_limit=10000,
+                           memory_limit=memory_limit,
+                           process_args=[sys.executable, '-c', code]).execute()
+
+
+def test_page_cache_is_not_charged(cgroup_root):
+    # Output is written to files, whose page cache the leaf is charged for
+    ret = run_python('import sys\n'
+                     'for i in range(48):\n'
+                     '    sys.stdout.buffer.write(b"x" * (1 << 20))\n',
+                     32 << 20)
+    assert ret.return_code == 0
+    assert len(ret.stdout) == 48 << 20
+    assert ret.memory < 32 << 20
+
+
+def test_allocation_beyond_limit_is_mle(cgroup_root):
+    ret = run_python('b = b"x" * (128 << 20)', 64 << 20)
+    assert ret.return_code != 0
+    assert ret.memory == 64 << 20
+
+
+def test_peak_is_not_carried_over(cgroup_root):
+    # Leaves are reused where the peak could be reset, replaced otherwise
+    first = run_python('b = b"x" * (48 << 20)', 256 << 20)
+    second = run_python('pass', 256 << 20)
+    assert first.return_code == 0 and second.return_code == 0
+    assert first.memory >= 48 << 20
+    assert second.memory < 48 << 20
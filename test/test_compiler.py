@@ -0,0 +1,44 @@
+import shutil
+
+import pytest
+
+from pyjudge import compiler
+from pyjudge import config
+
+
+@pytest.mark.skipif(not shutil.which('g++'), reason='requires G++')
+def test_output_limit_spares_compilers(tmp_path):
+    # Initialized static data is written into the executable as it is
+    source = tmp_path / 'static.cpp'
+    source.write_text('#include <cstdio>\n'
+                      'int a[20000000] = {1};\n'
+                      'int main() { printf("%d\\n", a[0]); }\n')
+    max_output = config.get_config('max_output')
+    config.set_config('max_output', 16 * 1024 * 1024)
+    c = compiler.CppCompiler(str(source))
+    try:
+        assert c.compile().return_code == 0
+        assert bytes(c.execute().stdout) == b'1\n'
+    finally:
+        c.close()
+        config.set_config('max_output', max_output)
+
+
+@pytest.mark.parametrize('python_zygote', [False, True])
+def test_python_runs_beside_its_source(tmp_path, python_zygote):
+    # Bytecode runs from the temporary directory in place of the source
+    (tmp_path / 'helper.py').write_text('value = 42\n')
+    source = tmp_path / 'gen.py'
+    source.write_text('import helper\n'
+                      'print(helper.value, __file__)\n')
+    zygote = config.get_config('python_zygote')
+    config.set_config('python_zygote', python_zygote)
+    c = compiler.Python3Compiler(str(source))
+    try:
+        c.compile()
+        ret = c.execute()
+    finally:
+        c.close()
+        config.set_config('python_zygote', zygote)
+    assert ret.return_code == 0
+    assert bytes(ret.stdout) == b'42 %s\n' % str(source).encode()
@@ -0,0 +1,108 @@
+import os
+import shutil
+import textwrap
+
+import pytest
+
+from pyjudge import judger
+from pyjudge import process
+
+data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'luogu_P1001')
+
+
+def write_cases(directory, numbers, suffix, answer=False):
+    for number in numbers:
+        path = os.path.join(directory, 'data%d.%s' % (number, suffix))
+        with open(path, 'w') as f_handle:
+            f_handle.write('%d\n' % (2 * number) if answer else
+                           '%d %d\n' % (number, number))
+        continue
+    return
+
+
+@pytest.mark.skipif(not shutil.which('g++'), reason='requires G++')
+def test_directory_cases_pair_by_number(tmp_path):
+    write_cases(str(tmp_path), [0, 1, 2, 3], 'in')
+    write_cases(str(tmp_path), [1, 2, 3], 'ans', answer=True)
+    j = judger.DataComparisonJudger(
+        input_handle=str(tmp_path / 'data.in*'),
+        out_handle=os.path.join(data_dir, 'AC.cpp'),
+        stdout_handle=str(tmp_path / 'data.ans*'))
+    try:
+        result = j.judge(time_limit=1000, memory_limit=256 * 1024 * 1024)
+    finally:
+        j.close()
+    assert result.judge_result == 'IJI'
+    assert 'input only 0' in result.judge_message
+    os.remove(str(tmp_path / 'data0.in'))
+    j = judger.DataComparisonJudger(
+        input_handle=str(tmp_path / 'data.in*'),
+        out_handle=os.path.join(data_dir, 'AC.cpp'),
+        stdout_handle=str(tmp_path / 'data.ans*'))
+    try:
+        results = [j.judge(time_limit=1000, memory_limit=256 * 1024 * 1024)
+                   for i in range(0, 3)]
+    finally:
+        j.close()
+    assert [result.judge_result for result in results] == ['AC'] * 3
+
+
+@pytest.mark.skipif(not shutil.which('g++'), reason='requires G++')
+@pytest.mark.parametrize('source', ['AC.cpp', 'CE.cpp'])
+def test_export_tests_only_of_judged_data(tmp_path, source):
+    # Neither input nor standard output runs for submissions failing to compile
+    (tmp_path / 'CE.cpp').write_text('int main() { return }\n')
+    out_handle = os.path.join(data_dir, source)
+    if not os.path.exists(out_handle):
+        out_handle = str(tmp_path / source)
+    j = judger.DataComparisonJudger(
+        input_handle=os.path.join(data_dir, 'test.in'),
+        out_handle=out_handle,
+        stdout_handle=os.path.join(data_dir, 'test.ans'))
+    try:
+        results = [j.judge(time_limit=1000, memory_limit=256 * 1024 * 1024)
+                   for i in range(0, 2)]
+    finally:
+        j.close()
+    export_dir = str(tmp_path / 'export')
+    count = judger.export_tests(results, export_dir)
+    if source == 'CE.cpp':
+        assert count == 0
+        assert os.listdir(export_dir) == []
+    else:
+        assert count == 2
+        with open(os.path.join(export_dir, 'data1.in'), 'rb') as f_handle:
+            assert f_handle.read().strip()
+
+
+@pytest.mark.skipif(not process.platform_event_watchdog,
+                    reason='requires Linux')
+@pytest.mark.parametrize('user_code, judge_result', [
+    # Sleeping is not waiting for the interactor
+    ('import time\n'
+     'n = int(input())\n'
+     'time.sleep(0.5)\n'
+     'print(n * 2, flush=True)\n', 'AC'),
+    # Both wait for each other's input
+    ('n = int(input())\n'
+     'print(n * 2, flush=True)\n'
+     'input()\n', 'TLE'),
+])
+def test_interactive_idleness(tmp_path, user_code, judge_result):
+    (tmp_path / 'interactor.py').write_text(textwrap.dedent("""\
+        import sys
+        print(5, flush=True)
+        if int(input()) != 10:
+            sys.exit(1)
+        sys.stdin.read()
+        """))
+    (tmp_path / 'user.py').write_text(user_code)
+    j = judger.InteractiveJudger(
+        interactor_handle=str(tmp_path / 'interactor.py'),
+        out_handle=str(tmp_path / 'user.py'))
+    try:
+        result = j.judge(time_limit=5000, memory_limit=256 * 1024 * 1024)
+    finally:
+        j.close()
+    assert result.judge_result == judge_result
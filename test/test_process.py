@@ -0,0 +1,50 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+from pyjudge import judger
+from pyjudge import process
+
+data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'luogu_P1001')
+
+
+@pytest.mark.skipif(not process.platform_event_watchdog or
+                    not shutil.which('g++'),
+                    reason='requires Linux and G++')
+@pytest.mark.parametrize('memory_limit', [
+    64 * 1024 * 1024,  # Static array beyond the address space limit
+    256 * 1024 * 1024,  # Static array within, exceeding the resident limit
+])
+def test_static_array_is_mle(memory_limit):
+    j = judger.DataComparisonJudger(
+        input_handle=os.path.join(data_dir, 'test.in'),
+        out_handle=os.path.join(data_dir, 'MLE_static.cpp'),
+        stdout_handle=os.path.join(data_dir, 'test.ans'))
+    try:
+        result = j.judge(time_limit=10000, memory_limit=memory_limit)
+    finally:
+        j.close()
+    assert result.judge_result == 'MLE'
+
+
+def test_read_static_memory():
+    assert process.read_static_memory(__file__) == 0
+    if os.path.exists('/bin/sh'):
+        assert process.read_static_memory('/bin/sh') > 0
+
+
+@pytest.mark.skipif(not process.platform_event_watchdog,
+                    reason='requires Linux')
+def test_peak_memory_before_exit():
+    # Allocated right before exit, likely between samples
+    args = [sys.executable, '-c', 'b = b"x" * (100 << 20)']
+    ret = process.Process(time_limit=10000, memory_limit=256 * 1024 * 1024,
+                          process_args=args).execute()
+    assert ret.return_code == 0
+    assert ret.memory >= 100 * 1024 * 1024
+    ret = process.Process(time_limit=10000, memory_limit=96 * 1024 * 1024,
+                          process_args=args).execute()
+    assert ret.memory == 96 * 1024 * 1024